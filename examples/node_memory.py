@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+'''Memory held by a parsed document for each of its nodes, measured with
+tracemalloc. The source text is made before tracing starts, so it is not
+counted. Each git revision given is measured with its own pyorg2/org.py,
+next to the tree in use. By default they are the revisions before and
+after the nodes got __slots__.
+Run as: python examples/node_memory.py [sections [revision ...]]'''
+import subprocess
+import sys
+import tracemalloc
+import types
+from pathlib import Path
+try:
+    import pyorg2 as test_import
+except ModuleNotFoundError:
+    parent = str(Path(__file__).resolve().parent.parent)
+    sys.path.append(parent)
+import pyorg2.org
+from pyorg2.org import Org
+
+# the nodes kept their attributes in a __dict__, then in __slots__
+REVISIONS = ('35c6776^', '35c6776')
+
+SECTION = '''* Heading <<target>>
+Some *bold* and /italic/ text
+that goes on for a second line.
+** Sub heading
+- first item
+- second item
+  - nested item
+1. one
+2. two
+- term :: definition
+| a | b | c |
+| d | e | f |
+#+BEGIN_QUOTE
+quoted text
+#+END_QUOTE
+#+BEGIN_SRC python
+print('code')
+#+END_SRC
+'''
+
+
+def load_module(revision):
+    '''pyorg2/org.py as it was at a git revision'''
+    source = subprocess.run(['git', 'show', f'{revision}:pyorg2/org.py'],
+                            cwd=Path(pyorg2.org.__file__).parent, check=True,
+                            capture_output=True, text=True).stdout
+    module = types.ModuleType(f'org_{revision}')
+    exec(compile(source, f'{revision}:pyorg2/org.py', 'exec'), module.__dict__)
+    return module
+
+
+def measure(org_class, text, **kwargs):
+    tracemalloc.start()
+    org = org_class(text, **kwargs)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return len(org._span_nodes), size
+
+
+def main(sections=2000, *revisions):
+    text = SECTION * sections
+    columns = [(revision, load_module(revision).Org) for revision in revisions or REVISIONS]
+    columns.append(('tree', Org))
+    print(f'{"":22} {"nodes":>8}' + ''.join(f' {name:>10}' for name, _ in columns))
+    for kwargs in ({}, {'zero_copy': True}):
+        sizes = [measure(org_class, text, **kwargs) for _, org_class in columns]
+        nodes = sizes[0][0]
+        print(f'{str(kwargs):22} {nodes:8}' + ''.join(f' {size / nodes:8.0f} B' for _, size in sizes))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]], *sys.argv[2:])
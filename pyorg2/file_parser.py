@@ -4,10 +4,11 @@ from .org import Org, org_to_html
 
 class OrgFileParser:
 
-    def __init__(self, default_heading=1):
+    def __init__(self, default_heading=1, strict=True):
         self.default_heading = default_heading
+        self.strict = strict  # with strict=False one bad file does not stop a batch
         self.nodes = []
-        self.id_map = {}  # Global ID map across files
+        self.diagnostics = {}  # file path to the problems a tolerant parse got past
 
     def parse_file(self, file_path):
         file_path = Path(file_path)
@@ -15,11 +16,10 @@ class OrgFileParser:
             raise FileNotFoundError(f"{file_path} is not a valid file")
         with file_path.open('r', encoding='utf-8') as f:
             text = f.read()
-        # Use filename as fallback ID if no #+ID:
-        file_id = file_path.stem if '#+ID:' not in text else None
-        org = Org(text, self.default_heading, file_id=file_id)
+        org = Org(text, self.default_heading, strict=self.strict)
+        if org.diagnostics:
+            self.diagnostics[file_path] = org.diagnostics
         self.nodes.append(org)
-        self.id_map.update(org.id_map)  # Collect IDs
         return org
 
     def parse_directory(self, directory_path):
@@ -41,7 +41,7 @@ class OrgFileParser:
     def to_html(self, newline='', wrap=True):
         if not self.nodes:
             return ''
-        content = newline.join(node.html(newline, id_map=self.id_map) for node in self.nodes)
+        content = newline.join(node.html(newline) for node in self.nodes)
         if wrap:
             return f'<html><body>{content}</body></html>'
         return content
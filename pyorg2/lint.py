@@ -0,0 +1,216 @@
+# pyorg2/lint.py
+from .org import Diagnostic, Parser
+
+
+def lint(source):
+    '''Check org text, or an iterable of lines such as an open file, without
+    building a tree. Returns a list of Diagnostic sorted by line for:
+
+    unbalanced #+BEGIN_QUOTE and #+BEGIN_SRC blocks, reported as a tolerant
+        parse reports them in Org.diagnostics
+    list items indented to match no enclosing item
+    table rows with a different number of cells than the first row
+    [[#anchor]] links with no heading of that title and no <<anchor>> target
+        where the parser registers one, so exactly the links Org.html() leaves
+        unresolved
+
+    Memory does not grow with the number of lines read, only the lines of a
+    drawer that is still open are kept. The targets and the [[#anchor]] links
+    are collected until the end, so they grow with the number of them.
+    '''
+    if isinstance(source, str):
+        lines = source.splitlines()
+    else:
+        lines = Parser._split_chunks(source)
+    linter = _Linter(Parser())
+    for lineno, line in enumerate(lines):
+        linter.lint_line(line, lineno)
+    return linter.finish()
+
+
+class _Linter(object):
+    '''The state of a single lint, the block state of the parser without
+    its nodes'''
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.regexps = parser.regexps
+        self.match_line = parser._line_matcher()
+        self.diagnostics = []
+        self.bquote_flg = False
+        # (kind, list depth) of the nodes the parser would be inside of, the
+        # innermost last, kinds are 'top' for a heading or the document,
+        # 'para', 'quote', 'src', 'table' and the list rules
+        self.path = [('top', None)]
+        self.src_flg = False
+        self.bquote_lineno = None
+        self.src_lineno = None
+        self.in_section = False  # a heading has been read, drawers need one
+        # lines of a drawer that has not ended yet, read again as ordinary
+        # lines if a heading or the end comes first
+        self.drawer_lines = None
+        self.drawer_lineno = None
+        self.replaying = False  # reading the lines of a drawer again, see _Builder
+        self.list_indents = []  # indents of the open list items
+        self.table_cells = None  # cell count of the open table's first row
+        self.targets = set()
+        self.links = []  # (lineno, anchor) of the internal links, checked at the end
+
+    def finish(self):
+        while self.drawer_lines is not None:
+            self._abandon_drawer()
+        if self.src_flg:
+            self._error(self.src_lineno, '#+BEGIN_SRC is never closed')
+        if self.bquote_flg:
+            self._error(self.bquote_lineno, '#+BEGIN_QUOTE is never closed')
+        for lineno, anchor in self.links:
+            if anchor not in self.targets:
+                self._error(lineno, f'link to #{anchor} has no target')
+        self.diagnostics.sort(key=lambda diagnostic: diagnostic.line)
+        return self.diagnostics
+
+    def _error(self, lineno, message):
+        self.diagnostics.append(Diagnostic(lineno + 1, message))
+
+    def lint_line(self, line, lineno):
+        if self.drawer_lines is not None and self._drawer_line(line):
+            return
+        if self.src_flg and not self.regexps['src_end'].match(line):
+            return
+        rule, m = self.match_line(line)
+        self._lint_matched(rule, m, line, lineno)
+
+    def _lint_matched(self, rule, m, line, lineno):
+        if rule == 'drawer_begin':
+            if (self.in_section and not self.bquote_flg and not self.replaying
+                    and m.group('name').upper() != 'END'):
+                self.drawer_lines = [line]
+                self.drawer_lineno = lineno
+                return
+            rule = None
+        if rule != 'tablerow':
+            self.table_cells = None
+        if rule == 'heading':
+            self.in_section = True
+            self.path = [('top', None)]  # the parser leaves any quote for the heading
+            self.list_indents = []
+            self.targets.add(m.group('title'))
+            return
+        if rule == 'internal_link':
+            self.links.append((lineno, m.group('anchor')))
+            return
+        path = self.path
+        if rule == 'blockquote_begin':
+            self.bquote_flg = True
+            self.bquote_lineno = lineno
+            path.append(('quote', None))
+        elif rule == 'blockquote_end':
+            if not self.bquote_flg:
+                self._error(lineno, '#+END_QUOTE without #+BEGIN_QUOTE')
+                return
+            self.bquote_flg = False
+            kinds = [kind for kind, _ in path]
+            if 'quote' not in kinds:
+                self._error(lineno, '#+END_QUOTE outside of its quote')
+                return
+            del path[len(kinds) - 1 - kinds[::-1].index('quote'):]
+        elif rule == 'src_begin':
+            self.src_flg = True
+            self.src_lineno = lineno
+            path.append(('src', None))
+        elif rule == 'src_end':
+            if not self.src_flg:
+                self._error(lineno, '#+END_SRC without #+BEGIN_SRC')
+                return
+            self.src_flg = False
+            path.pop()
+        elif rule in ('orderedlist', 'unorderedlist', 'definitionlist'):
+            depth = len(m.group('depth'))
+            self._lint_item(depth, lineno)
+            self._enter_list(rule, depth)
+        elif rule == 'tablerow':
+            if path[-1][0] != 'tablerow':
+                path.append(('tablerow', None))
+            self._lint_row(m.group('cells'), lineno)
+        elif line:
+            self.list_indents = []
+            if path[-1][0] == 'top':
+                path.append(('para', None))  # the first line of a paragraph
+            else:
+                self._check_target(line)
+        elif path[-1][0] == 'para':
+            path.pop()
+
+    def _enter_list(self, rule, depth):
+        '''Follow the parser into the list of an item, as _Builder._add_list_node'''
+        path = self.path
+        while path[-1][0] == 'para':
+            path.pop()
+        kind, list_depth = path[-1]
+        if kind != rule or depth > list_depth:
+            path.append((rule, depth))
+        while path[-1][0] == rule and depth < path[-1][1]:
+            path.pop()
+
+    def _check_target(self, line):
+        '''Note the target that the parser registers for a text line that
+        continues a node, only the first and none on a line with a link'''
+        if '[[#' in line and self.regexps['internal_link'].search(line):
+            return
+        if '<<' in line:
+            m = self.regexps['target'].search(line)
+            if m:
+                self.targets.add(m.group('target'))
+
+    def _lint_item(self, indent, lineno):
+        indents = self.list_indents
+        if indents and indent < indents[-1]:
+            while indents and indent < indents[-1]:
+                indents.pop()
+            if not indents or indents[-1] != indent:
+                self._error(lineno, f'list item indent {indent} lines up with no enclosing item')
+        if not indents or indent > indents[-1]:
+            indents.append(indent)
+
+    def _lint_row(self, row, lineno):
+        if row.startswith('-') and not row.strip('-+| '):
+            return  # |---+---| separator row
+        cells = [cell for cell in row.split('|') if cell != '']
+        for cell in cells:
+            if cell.startswith('[[#'):
+                m = self.regexps['internal_link'].match(cell)
+                if m:
+                    self.links.append((lineno, m.group('anchor')))
+                    continue
+            self._check_target(cell)
+        if self.table_cells is None:
+            self.table_cells = len(cells)
+        elif len(cells) != self.table_cells:
+            self._error(lineno, f'table row has {len(cells)} cells, the table has {self.table_cells}')
+
+    def _drawer_line(self, line):
+        '''Hold a line of the open drawer, returns False for a heading line
+        or a #+BEGIN_SRC line'''
+        if ((line.startswith('*') and self.regexps['heading'].match(line))
+                or (line.startswith('#+BEGIN_SRC') and self.regexps['src_begin'].match(line))):
+            while self.drawer_lines is not None:
+                self._abandon_drawer()
+            return False
+        if self.regexps['drawer_end'].match(line):
+            self.drawer_lines = None
+            while self.path[-1][0] == 'para':
+                self.path.pop()
+        else:
+            self.drawer_lines.append(line)
+        return True
+
+    def _abandon_drawer(self):
+        '''Lint the lines of a drawer that never ended as ordinary lines'''
+        lines = self.drawer_lines
+        lineno = self.drawer_lineno
+        self.drawer_lines = None
+        self._lint_matched(None, None, lines[0], lineno)
+        self.replaying = True
+        for offset, line in enumerate(lines[1:], 1):
+            self.lint_line(line, lineno + offset)
+        self.replaying = False
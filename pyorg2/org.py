@@ -1,4 +1,13 @@
-from re import compile
+import asyncio
+import gc
+import os
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+from re import compile, MULTILINE
+from weakref import ref
 from slugify import slugify  
 
 
@@ -15,14 +24,19 @@ from slugify import slugify
 # quotes, block quotes code block codes
 
 class Syntax(object):
-    LINK = r'\[\[(?P<url>https?://.+?)\](?:\[(?P<subject>.+?)\])?\]'
-    IMAGE = r'\[\[(?P<image>.+?)\](?:\[(?P<alt>.+?)\])?\]'
-    BOLD = r'\*(?P<text>.+?)\*'
-    ITALIC = r'/(?P<text>.+?)/'
-    UNDERLINED = r'_(?P<text>.+?)_'
-    LINETHROUGH = r'\+(?P<text>.+?)\+'
-    CODE = r'=(?P<text>.+?)='
-    MONOSPACE = r'~(?P<text>.+?)~'
+    # Every pattern must match in linear time, the parser runs them on
+    # untrusted input. Bracketed parts stop at the next bracket and the
+    # emphasis text is one non space character followed by anything but the
+    # closing delimiter, so it never opens on a space or a line break.
+    LINK = r'\[\[(?P<url>https?://[^][]+)\](?:\[(?P<subject>[^][]+)\])?\]'
+    IMAGE = r'\[\[(?P<image>[^][]+)\](?:\[(?P<alt>[^][]+)\])?\]'
+    # Emphasis may run over one line break of a paragraph, as in Emacs.
+    BOLD = r'\*(?P<text>\S[^*\n]*(?:\n[^*\n]*)?)\*'
+    ITALIC = r'/(?P<text>\S[^/\n]*(?:\n[^/\n]*)?)/'
+    UNDERLINED = r'_(?P<text>\S[^_\n]*(?:\n[^_\n]*)?)_'
+    LINETHROUGH = r'\+(?P<text>\S[^+\n]*(?:\n[^+\n]*)?)\+'
+    CODE = r'=(?P<text>\S[^=\n]*(?:\n[^=\n]*)?)='
+    MONOSPACE = r'~(?P<text>\S[^~\n]*(?:\n[^~\n]*)?)~'
     WHITELINE = r'\s*$'
     HEADING = r'(?P<level>\*+)\s+(?P<title>.+)$'
     QUOTE_BEGIN = r'#\+BEGIN_QUOTE(?P<c>:)?(?(c)\s+(?P<cite>.+)|)$'
@@ -31,11 +45,15 @@ class Syntax(object):
     SRC_END = r'#\+END_SRC'
     ORDERED_LIST = r'(?P<depth>\s*)\d+(\.|\))\s+(?P<item>.+)$'
     UNORDERED_LIST = r'(?P<depth>\s*)(-|\+)\s+(?P<item>.+)$'
-    DEF_LIST = r'(?P<depth>\s*)(-|\+)\s+(?P<item>.+?)\s*::\s*(?P<desc>.+)$'
-    TABLE_ROW = r'\s*\|(?P<cells>(.+\|)+)s*$'
+    # the item starts and ends with non space so the spaces around it are
+    # only ever matched by one of the \s quantifiers
+    DEF_LIST = r'(?P<depth>\s*)(-|\+)\s+(?P<item>\S(?:.*?\S)??)\s*::\s*(?P<desc>.+)$'
+    TABLE_ROW = r'\s*\|(?P<cells>.+\|)\s*$'
+    DRAWER_BEGIN = r'\s*:(?P<name>[\w-]+):\s*$'  # :LOGBOOK:, :END: is not a drawer
+    DRAWER_END = r'\s*:(?i:END):\s*$'
     # [[#anchor][title]] or [[#anchor]]
-    INTERNAL_LINK = r'\[\[#(?P<anchor>[^][]+?)\](?:\[(?P<title>.+?)\])?\]'
-    TARGET = r'<<(?P<target>[^>]+)>>'  # <<target>>
+    INTERNAL_LINK = r'\[\[#(?P<anchor>[^][]+)\](?:\[(?P<title>[^][]+)\])?\]'
+    TARGET = r'<<(?P<target>[^<>]+)>>'  # <<target>>
 
 
 class BaseError(Exception):
@@ -44,13 +62,162 @@ class BaseError(Exception):
 class NestingNotValidError(BaseError):
     pass
 
+class LimitExceededError(BaseError):
+    '''A document went over one of the Limits its parser was given, limit
+    is the name of the Limits attribute'''
+
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+
+class Limits:
+    '''Bounds for parsing untrusted text, each one None for no bound:
+
+    max_nodes -- nodes the block parser may build, a reparse counts the
+        nodes of the whole document
+    max_depth -- nesting of nodes below the document
+    max_line_length -- characters in a line
+    max_inline_depth -- inline markup nested in inline markup, checked when
+        the markup is parsed for rendering
+    max_seconds -- time a parse or reparse may take
+    '''
+
+    def __init__(self, max_nodes=1000000, max_depth=100, max_line_length=100000,
+                 max_inline_depth=20, max_seconds=10.0):
+        self.max_nodes = max_nodes
+        self.max_depth = max_depth
+        self.max_line_length = max_line_length
+        self.max_inline_depth = max_inline_depth
+        self.max_seconds = max_seconds
+
+
+class Diagnostic:
+    '''A problem found while parsing in tolerant mode, line counts from 1'''
+
+    def __init__(self, line, message):
+        self.line = line
+        self.message = message
+
+    def __str__(self):
+        return f'line {self.line}: {self.message}'
+
+
+def _no_ref():
+    return None
+
+
+def _weak(obj):
+    '''A weak reference to obj, or for None a callable returning None'''
+    if obj is None:
+        return _no_ref
+    return ref(obj)
+
+
 class OrgElement:
+    '''Base class of everything in a document. A large document has a great
+    many of these, so they keep their attributes in __slots__ and leave
+    unset the ones that still have their default, as is_target.
+    The links up the tree, org_root and parent, are weak references, so a
+    document holds no reference cycle and is freed as soon as the last
+    reference to its Org goes. A node kept on its own has None for them,
+    and reading what it takes from its Org, as a zero copy title or
+    Drawer.org, raises ReferenceError. The weak references cost about 50
+    bytes per node, one for each node that has children.'''
+    __slots__ = ('_org_root', '_parent', '_is_target', '_target_string', '__weakref__')
+    _slots = {}  # class to its slots, for pickle
 
     def __init__(self, org_root):
-        self.org_root = org_root
-        self.is_target = False
-        # if element is a target, this is the "link to" text
-        self.target_string = None 
+        self._org_root = _no_ref if org_root is None else ref(org_root)
+
+    @property
+    def is_target(self):
+        try:
+            return self._is_target
+        except AttributeError:
+            return False
+
+    @is_target.setter
+    def is_target(self, is_target):
+        self._is_target = is_target
+
+    @property
+    def target_string(self):
+        '''if element is a target, this is the "link to" text'''
+        try:
+            return self._target_string
+        except AttributeError:
+            return None
+
+    @target_string.setter
+    def target_string(self, target_string):
+        self._target_string = target_string
+
+    @property
+    def org_root(self):
+        return self._org_root()
+
+    @org_root.setter
+    def org_root(self, org_root):
+        self._org_root = _weak(org_root)
+
+    def _get_root(self):
+        '''The org_root for a node that needs it to read its source or to
+        parse, it raises ReferenceError when the Org is gone'''
+        org_root = self._org_root()
+        if org_root is None:
+            raise ReferenceError(f'{self.type_} is not part of a live Org, keep a reference '
+                                 'to the Org while its nodes are used')
+        return org_root
+
+    @property
+    def parent(self):
+        return self._parent()
+
+    @parent.setter
+    def parent(self, parent):
+        self._parent = _weak(parent)
+
+    @property
+    def type_(self):
+        return self.__class__.__name__
+
+    def __getstate__(self):
+        '''The attributes for pickle, with the objects the weak links point to'''
+        values = []
+        for slot in self._get_slots():
+            try:
+                values.append(slot.__get__(self))
+            except AttributeError:
+                values.append(_Unset)
+        return self.org_root, self.parent, values, getattr(self, '__dict__', None)
+
+    def __setstate__(self, state):
+        org_root, parent, values, attributes = state
+        self._org_root = _weak(org_root)
+        self._parent = _weak(parent)
+        for slot, value in zip(self._get_slots(), values):
+            if value is not _Unset:
+                slot.__set__(self, value)
+        if attributes:
+            self.__dict__.update(attributes)
+
+    @classmethod
+    def _get_slots(cls):
+        '''The descriptors of the slots other than the weak links, they reach
+        slots that a subclass property hides, as CodeBlock.children'''
+        slots = OrgElement._slots.get(cls)
+        if slots is None:
+            slots = [klass.__dict__[name] for klass in cls.__mro__
+                     for name in klass.__dict__.get('__slots__', ())
+                     if name not in ('_org_root', '_parent', '__weakref__')]
+            OrgElement._slots[cls] = slots
+        return slots
+
+
+class _Unset:
+    '''Stands for a slot with no value in a pickled node'''
+
 
 class Target:
 
@@ -69,14 +236,14 @@ class Target:
         
 class Node(OrgElement):
     '''Base class for elements that may have children, nodes in a tree'''
-    
+    __slots__ = ('children',)
+
     def __init__(self, org_root, parent=None):
         super().__init__(org_root)
-        self.type_ = self.__class__.__name__
         self.children = []
-        self.parent = parent
-        if self.parent is None:
-            self.parent = org_root
+        if parent is None:
+            parent = org_root
+        self._parent = _no_ref if parent is None else ref(parent)
 
     def __str__(self):
         str_children = [str(child) for child in self.children]
@@ -86,7 +253,7 @@ class Node(OrgElement):
         if isinstance(child, str):
             child = Text(self, child)
         self.children.append(child)
-        child.parent = self
+        child._parent = ref(self)
 
     def html(self, br='', lstrip=False):
         '''Get HTML'''
@@ -115,51 +282,116 @@ class TerminalNode(OrgElement):
         'monospace': compile(Syntax.MONOSPACE)
     }
 
+    __slots__ = ('noparse', '_value', '_values', '_span')
+
     def __init__(self, org_root, value, parent=None, noparse=False):
         super().__init__(org_root)
-        self.type_ = self.__class__.__name__
         self.noparse = noparse
-        self.org_root = org_root
-        self.values = self._parse_value(value)
-        self.parent = parent
+        self._value = value
+        self._span = None  # span number in org_root when the value is read from the source
+        self._values = None  # inline markup is parsed on first use
+        self._parent = _no_ref if parent is None else ref(parent)
+
+    @property
+    def value(self):
+        if self._span is None:
+            return self._value
+        return self._get_root()._span_text(self._span)
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._span = None
+
+    @property
+    def values(self):
+        '''The value split into strings and inline nodes, parsed on first access.
+        A value read from the source is parsed again on every access instead,
+        so that the strings are not kept.'''
+        if self._values is not None:
+            return self._values
+        values = self._parse_value(self.value)
+        if self._span is None:
+            self._values = values
+        return values
+
+    @values.setter
+    def values(self, values):
+        self._values = values
+
+    # inline rules in priority order, with a substring that must be present for
+    # the rule to match at all
+    inline_rules = (
+        ('code', '='),
+        ('link', '[[http'),
+        ('image', '[['),
+        ('bold', '*'),
+        ('italic', '/'),
+        ('underlined', '_'),
+        ('linethrough', '+'),
+        ('monospace', '~'),
+    )
+    markup = compile(r'[=\[*/_+~]')
 
     def _parse_value(self, value):
         if value is None:
             return ''
+        if self.noparse or not self.markup.search(value):
+            return [value]
+        self._check_inline_depth()
+        return self._scan_value(value, 0)
+
+    def _check_inline_depth(self):
+        '''Inline nodes have the node they were parsed from as org_root,
+        count them up to the document and check its parser's limits'''
+        depth = 0
+        root = self.org_root
+        while isinstance(root, TerminalNode):
+            depth += 1
+            root = root.org_root
+        limits = getattr(getattr(root, 'parser', None), 'limits', None)
+        if limits is not None and limits.max_inline_depth is not None:
+            if depth > limits.max_inline_depth:
+                raise LimitExceededError(
+                    'max_inline_depth',
+                    f'inline markup nested {depth} deep, the limit is {limits.max_inline_depth}')
+
+    def _scan_value(self, value, level):
+        '''Split value on all matches of the first inline rule, starting from
+        level, that matches anywhere in it. A higher priority rule cannot match
+        in the text between those matches, so that text is only scanned for the
+        remaining rules.'''
+        for index in range(level, len(self.inline_rules)):
+            name, trigger = self.inline_rules[index]
+            if trigger not in value:
+                continue
+            values = []
+            pos = 0
+            for m in self.regexps[name].finditer(value):
+                values.extend(self._scan_value(value[pos:m.start()], index + 1))
+                values.append(self._inline_node(name, m))
+                pos = m.end()
+            if pos:
+                values.extend(self._scan_value(value[pos:], index + 1))
+                return values
+        return [value]
 
-        if self.noparse:
-            before = after = None
-            parsed = value
-        elif self.regexps['code'].search(value):
-            before, text, after = self.regexps['code'].split(value, 1)
-            parsed = InlineCodeText(self, text)
-        elif self.regexps['link'].search(value):
-            before, url, subject, after = self.regexps['link'].split(value, 1)
-            parsed = Link(self, url, subject)
-        elif self.regexps['image'].search(value):
-            before, src, alt, after = self.regexps['image'].split(value, 1)
-            parsed = Image(self, src, alt)
-        elif self.regexps['bold'].search(value):
-            before, text, after = self.regexps['bold'].split(value, 1)
-            parsed = BoldText(self, text)
-        elif self.regexps['italic'].search(value):
-            before, text, after = self.regexps['italic'].split(value, 1)
-            parsed = ItalicText(self, text)
-        elif self.regexps['underlined'].search(value):
-            before, text, after = self.regexps['underlined'].split(value, 1)
-            parsed = UnderlinedText(self,text)
-        elif self.regexps['linethrough'].search(value):
-            before, text, after = self.regexps['linethrough'].split(value, 1)
-            parsed = LinethroughText(self,text)
-        elif self.regexps['monospace'].search(value):
-            before, text, after = self.regexps['monospace'].split(value, 1)
-            parsed = MonospaceText(self, text)
-        else:
-            before = after = None
-            parsed = value
-        before = self._parse_value(before) or []
-        after = self._parse_value(after) or []
-        return before + [parsed] + after
+    def _inline_node(self, name, m):
+        if name == 'code':
+            return InlineCodeText(self, m.group('text'))
+        elif name == 'link':
+            return Link(self, m.group('url'), m.group('subject'))
+        elif name == 'image':
+            return Image(self, m.group('image'), m.group('alt'))
+        elif name == 'bold':
+            return BoldText(self, m.group('text'))
+        elif name == 'italic':
+            return ItalicText(self, m.group('text'))
+        elif name == 'underlined':
+            return UnderlinedText(self, m.group('text'))
+        elif name == 'linethrough':
+            return LinethroughText(self, m.group('text'))
+        return MonospaceText(self, m.group('text'))
 
     def __str__(self):
         return self.type_
@@ -168,7 +400,14 @@ class TerminalNode(OrgElement):
         content = ''
         for value in self.values:
             if isinstance(value, str):
-                if lstrip:
+                # a text run holds several source lines, each rendered as the
+                # line it came from
+                if '\n' in value:
+                    if lstrip:
+                        content += br.join([line.strip() for line in value.split('\n')])
+                    else:
+                        content += br.join([line.rstrip() for line in value.split('\n')])
+                elif lstrip:
                     content += value.strip()
                 else:
                     content += value.rstrip()
@@ -185,9 +424,11 @@ class TerminalNode(OrgElement):
         raise NotImplementedError
 
 class InternalLink(TerminalNode):
+    __slots__ = ('anchor', 'link_text', 'resolved')
 
     def __init__(self, org_root, anchor, title):
         self.anchor = anchor
+        self.link_text = anchor  # anchor as written, resolution may replace it
         self.resolved = False  # Track resolution status
         super().__init__(org_root, title or anchor)
 
@@ -201,6 +442,8 @@ class InternalLink(TerminalNode):
 
 class Paragraph(Node):
     '''Paragraph Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<p>'
 
@@ -209,6 +452,8 @@ class Paragraph(Node):
 
 class Text(TerminalNode):
     '''Text Class'''
+    __slots__ = ()
+
     def get_text(self):
         return ''.join([str(value) for value in self.values])
 
@@ -221,6 +466,8 @@ class Text(TerminalNode):
 
 class BoldText(Text):
     '''Bold Text Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<span style="font-weight: bold;">'
 
@@ -230,6 +477,8 @@ class BoldText(Text):
 
 class ItalicText(Text):
     '''Italic Text Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<span style="text-style: italic;">'
 
@@ -239,6 +488,8 @@ class ItalicText(Text):
 
 class UnderlinedText(Text):
     '''Underlined Text Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<span style="text-decoration: underlined;">'
 
@@ -247,6 +498,8 @@ class UnderlinedText(Text):
 
 class LinethroughText(Text):
     '''Linethrough Text Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<span style="text-decoration: line-through;">'
 
@@ -255,6 +508,8 @@ class LinethroughText(Text):
 
 class InlineCodeText(Text):
     '''Inline Code Text Class'''
+    __slots__ = ()
+
     less_than = compile(r'<')
     greater_than = compile(r'>')
     def _parse_value(self, value):
@@ -265,6 +520,7 @@ class InlineCodeText(Text):
         content = self.values[0].strip()
         content = self.less_than.sub('&lt;', content)
         content = self.greater_than.sub('&gt;', content)
+        content = content.replace('\n', br)
         return self._get_open() + content + self._get_close()
 
     def _get_open(self):
@@ -276,6 +532,8 @@ class InlineCodeText(Text):
 
 class MonospaceText(Text):
     '''Monospace Text Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<span style="font-family: monospace;">'
 
@@ -285,6 +543,8 @@ class MonospaceText(Text):
 
 class Blockquote(Node):
     '''Blockquote Class'''
+    __slots__ = ('cite',)
+
     def __init__(self, org_root, cite=None):
         self.cite = cite
         super().__init__(org_root)
@@ -300,10 +560,70 @@ class Blockquote(Node):
 
 
 class CodeBlock(Node):
-    ''' Block class Code Class '''
+    ''' Block class Code Class, the source lines are kept as one body string
+    and Text children are only made if something asks for them '''
+    __slots__ = ('src_type', '_body', 'line_count', '_lines', '_children', '_span')
+
     def __init__(self, org_root, src_type=None):
         self.src_type = src_type
+        self._body = ''
+        self._span = None  # span number in org_root when the body is read from the source
+        self.line_count = 0
+        self._lines = []  # collects the lines until close()
         super().__init__(org_root)
+        self._children = None
+
+    @property
+    def children(self):
+        if self._children is None:
+            self._children = [Text(self.org_root, line, self, noparse=True)
+                              for line in self.get_lines()]
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    @property
+    def body(self):
+        if self._span is None:
+            return self._body
+        return self._get_root()._block_text(self._span, self.line_count)
+
+    @body.setter
+    def body(self, body):
+        self._body = body
+        self._span = None
+
+    def add_line(self, line):
+        self._lines.append(line)
+        self.line_count += 1
+
+    def close(self):
+        '''Join the collected lines into the body'''
+        if self._lines:
+            self.body = '\n'.join(self._lines)
+            self._lines = []
+
+    def get_lines(self):
+        self.close()
+        if not self.line_count:
+            return []
+        return self.body.split('\n')
+
+    def __str__(self):
+        if self._children is None:
+            return self.type_ + '(' + ' '.join(['Text'] * self.line_count) + ')'
+        return super().__str__()
+
+    def html(self, br='', lstrip=False):
+        if self._children is not None:
+            return super().html(br, lstrip)
+        if lstrip:
+            body = br.join([line.strip() for line in self.get_lines()])
+        else:
+            body = br.join([line.rstrip() for line in self.get_lines()])
+        return self._get_open() + body + self._get_close()
 
     def _get_open(self):
         if self.src_type:
@@ -317,11 +637,29 @@ class CodeBlock(Node):
 
 class Heading(Node):
     '''Heading Class'''
+    __slots__ = ('depth', '_title', '_span', 'drawers')
+
     def __init__(self, org_root, depth, title, default_depth=1):
         self.depth = depth + (default_depth -1)
-        self.title = title
+        self._title = title
+        self._span = None  # span number in org_root when the title is read from the source
+        self.drawers = {}  # drawer name to Drawer, the first of each name
         super().__init__(org_root)
-        self.type_ = 'Heading{}'.format(self.depth)
+
+    @property
+    def type_(self):
+        return 'Heading{}'.format(self.depth)
+
+    @property
+    def title(self):
+        if self._span is None:
+            return self._title
+        return self._get_root()._title_text(self._span)
+
+    @title.setter
+    def title(self, title):
+        self._title = title
+        self._span = None
 
     def html(self, br=''):
         heading = self._get_open() + self.title + self._get_close()
@@ -335,8 +673,88 @@ class Heading(Node):
         return '</h{}>'.format(self.depth)
 
 
+class Drawer(OrgElement):
+    '''A :NAME: ... :END: drawer of a heading. Its lines are kept as they
+    are, not rendered, and only parsed when one of the properties below is
+    asked for. A drawer cannot hold a source block, a #+BEGIN_SRC line
+    turns the lines held since :NAME: back into ordinary lines, as a
+    heading does.'''
+    __slots__ = ('name', '_lines', '_span', 'line_count', '_properties', '_clocks', '_org')
+
+    def __init__(self, org_root, name, parent):
+        super().__init__(org_root)
+        self.name = name
+        self.parent = parent
+        self._lines = []
+        self._span = None  # span number in org_root when the lines are read from the source
+        self.line_count = 0
+        self._properties = None
+        self._clocks = None
+        self._org = None
+
+    @property
+    def lines(self):
+        if self._span is None:
+            return self._lines
+        if not self.line_count:
+            return []
+        return self._get_root()._block_text(self._span, self.line_count).split('\n')
+
+    def add_line(self, line):
+        self._lines.append(line)
+        self.line_count += 1
+
+    @property
+    def properties(self):
+        '''The :KEY: value lines as a dict, :KEY+: adds to a value'''
+        if self._properties is None:
+            properties = {}
+            for line in self.lines:
+                line = line.strip()
+                if not line.startswith(':'):
+                    continue
+                key, sep, value = line[1:].partition(':')
+                if not sep or not key:
+                    continue
+                value = value.strip()
+                if key.endswith('+'):
+                    key = key[:-1]
+                    if key in properties:
+                        value = f'{properties[key]} {value}'
+                properties[key] = value
+            self._properties = properties
+        return self._properties
+
+    @property
+    def clocks(self):
+        '''(start, end, duration) for every CLOCK: line, end and duration
+        are None for a clock that is still running'''
+        if self._clocks is None:
+            clocks = []
+            for line in self.lines:
+                line = line.strip()
+                if not line.startswith('CLOCK:'):
+                    continue
+                times, _, duration = line[6:].partition('=>')
+                start, _, end = times.strip().partition('--')
+                clocks.append((start.strip('[]'), end.strip('[]') or None,
+                               duration.strip() or None))
+            self._clocks = clocks
+        return self._clocks
+
+    @property
+    def org(self):
+        '''The lines parsed as org text'''
+        if self._org is None:
+            org_root = self._get_root()
+            self._org = org_root.parser.parse('\n'.join(self.lines), org_root)
+        return self._org
+
+
 class List(Node):
     '''Classes that make up a list derive from this base class, forming a tree'''
+    __slots__ = ('depth', 'ordered', 'definition', 'start')
+
     def __init__(self, org_root, depth, ordered, definition, start=1):
         self.depth = depth
         self.ordered = ordered
@@ -351,6 +769,8 @@ class List(Node):
 
 class ListItem(TerminalNode):
     '''List Item Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<li>'
 
@@ -360,6 +780,8 @@ class ListItem(TerminalNode):
 
 class OrderedList(List):
     '''Shortcut Class of Ordered List'''
+    __slots__ = ()
+
     def __init__(self, org_root, depth, start=1):
         super().__init__(org_root, depth, True, False, start)
 
@@ -372,6 +794,8 @@ class OrderedList(List):
 
 class UnOrderedList(List):
     '''Shortcut Class of UnOrdered List'''
+    __slots__ = ()
+
     def __init__(self, org_root, depth):
         super().__init__(org_root, depth, False, False)
 
@@ -384,6 +808,8 @@ class UnOrderedList(List):
 
 class DefinitionList(List):
     '''Shortcut Class of Definition List'''
+    __slots__ = ()
+
     def __init__(self, org_root, depth):
         super().__init__(org_root, depth, False, True)
 
@@ -396,10 +822,12 @@ class DefinitionList(List):
 
 class DefinitionListItem(Node):
     '''Definition List Item Class'''
+    __slots__ = ()
+
     def __init__(self, org_root, title, description):
         super().__init__(org_root)
-        self.children.append(DefinitionListItemTitle(org_root, title))
-        self.children.append(DefinitionListItemDescription(org_root, description))
+        self.children.append(DefinitionListItemTitle(org_root, title, self))
+        self.children.append(DefinitionListItemDescription(org_root, description, self))
 
     def _get_open(self):
         return ''
@@ -409,6 +837,8 @@ class DefinitionListItem(Node):
 
 
 class DefinitionListItemTitle(TerminalNode):
+    __slots__ = ()
+
     def _get_open(self):
         return '<dt>'
 
@@ -417,6 +847,8 @@ class DefinitionListItemTitle(TerminalNode):
 
 
 class DefinitionListItemDescription(TerminalNode):
+    __slots__ = ()
+
     def _get_open(self):
         return '<dd>'
 
@@ -426,6 +858,8 @@ class DefinitionListItemDescription(TerminalNode):
 
 class Table(Node):
     '''Table Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<table>'
 
@@ -435,6 +869,8 @@ class Table(Node):
 
 class TableRow(Node):
     '''Table Row Class'''
+    __slots__ = ()
+
     def _get_open(self):
         return '<tr>'
 
@@ -444,6 +880,8 @@ class TableRow(Node):
 
 class TableCell(Node):
     '''Table Cell Class'''
+    __slots__ = ()
+
     def html(self, br='', lstrip=False):
         '''Get HTML'''
         inner = br.join([child.html(br, True) for child in self.children])
@@ -458,6 +896,8 @@ class TableCell(Node):
 
 class Link(TerminalNode):
     '''Link Class'''
+    __slots__ = ('href',)
+
     def __init__(self, org_root, href, title):
         self.href = href
         if title is None:
@@ -473,6 +913,8 @@ class Link(TerminalNode):
 
 class Image(TerminalNode):
     '''Image Class'''
+    __slots__ = ('src',)
+
     def __init__(self, org_root, src, alt=""):
         self.src = src
         super().__init__(org_root, alt)
@@ -484,8 +926,665 @@ class Image(TerminalNode):
             return '<img src="{}">'.format(self.src) + br
 
 
+def _line_starts(text):
+    '''Offset of each line of text, lines split at \\n only'''
+    starts = array('l', [0])
+    find = text.find
+    i = find('\n')
+    while i != -1:
+        starts.append(i + 1)
+        i = find('\n', i + 1)
+    return starts
+
+
+def _line_end(text, starts, line):
+    if line + 1 < len(starts):
+        return starts[line + 1] - 1
+    return len(text)
+
+
+class _Piece:
+    '''A run of the source lines of an edited document, with the records
+    parsed from them as ranges of Org._spans (span numbers), Org._headings
+    and Org._target_lines. The records count lines from raw, the number
+    the run's first line had when they were parsed. Where the run starts in
+    the document follows from the lengths of the runs before it, so an
+    edit leaves the records after it alone. In zero copy mode text holds
+    the lines at their raw numbers and starts the offsets of its lines.'''
+    __slots__ = ('lines', 'raw', 'spans', 'headings', 'targets', 'text', 'starts')
+
+    def __init__(self, lines, raw, spans, headings, targets, text=None, starts=None):
+        self.lines = lines
+        self.raw = raw
+        self.spans = spans
+        self.headings = headings
+        self.targets = targets
+        self.text = text
+        self.starts = starts
+
+    def get_starts(self):
+        if self.starts is None:
+            self.starts = _line_starts(self.text)
+        return self.starts
+
+    def source(self):
+        '''The text of the lines of the run'''
+        starts = self.get_starts()
+        return self.text[starts[self.raw]:_line_end(self.text, starts, self.raw + self.lines - 1)]
+
+
 class Org(object):
     '''The org-mode object'''
+
+    def __init__(self, text, default_heading=1, parent=None, engine='fast',
+                 coalesce=None, strict=True, zero_copy=False, skip_excluded=False,
+                 limits=None):
+        parser = Parser(default_heading, engine=engine, coalesce=coalesce, strict=strict,
+                        zero_copy=zero_copy, skip_excluded=skip_excluded, limits=limits)
+        self._setup(parser, parent)
+        parser._parse_text(self, text)
+
+    @classmethod
+    def from_lines(cls, lines, default_heading=1, parent=None, engine='fast',
+                   coalesce=None, strict=True, zero_copy=False, skip_excluded=False,
+                   limits=None):
+        '''Build an Org from an iterable of lines, consuming one line at a time.
+        Lines may keep their line endings, the source text is not retained.'''
+        parser = Parser(default_heading, engine=engine, coalesce=coalesce, strict=strict,
+                        zero_copy=zero_copy, skip_excluded=skip_excluded, limits=limits)
+        return parser.parse_lines(lines, parent)
+
+    @classmethod
+    def from_file(cls, fileobj, default_heading=1, parent=None, engine='fast',
+                  encoding='utf-8', coalesce=None, strict=True, zero_copy=False,
+                  skip_excluded=False, limits=None):
+        '''Build an Org by reading an open file line by line, lines read from
+        a binary file are decoded with encoding'''
+        parser = Parser(default_heading, engine=engine, coalesce=coalesce, strict=strict,
+                        zero_copy=zero_copy, skip_excluded=skip_excluded, limits=limits)
+        return parser.parse_file(fileobj, parent, encoding)
+
+    def _setup(self, parser, parent):
+        self.parser = parser  # used again by reparse()
+        self.default_heading = parser.default_heading
+        self.engine = parser.engine
+        self.coalesce = parser.coalesce
+        self.strict = parser.strict
+        self.zero_copy = parser.zero_copy
+        self.skip_excluded = parser.skip_excluded
+        self.children = []
+        self.parent = parent
+        self._text = None
+        self.targets = {}  # Map of <<target>> to nodes
+        # source lines, kept once the document has been edited with reparse()
+        self.lines = None
+        # (line number, heading, parsed outside of any block) for each heading
+        self._headings = []
+        # (line number, target, node) for each target registered, in order
+        self._target_lines = []
+        # unbalanced blocks that a tolerant parse closed or skipped
+        self.diagnostics = []
+        # depth of the excluded heading being skipped when the parse ended
+        self._skip_depth = None
+        # source span of every node built by the parser, in document order:
+        # start line, start column, end line, end column, the end not included
+        self._spans = array('l')
+        self._span_nodes = []
+        self._span_index = None  # node to span number, built when needed
+        self._line_starts = None  # offset of each line in text, for zero copy
+        # once the document is edited the records above only grow, _Pieces
+        # in document order say which of them are live and where they are
+        self._pieces = None
+        self._dead_spans = 0  # spans of replaced pieces
+        self._target_names = None  # target name to its live record numbers
+        self._drop_piece_tables()
+
+    def _drop_piece_tables(self):
+        # worked out from the pieces when needed
+        self._piece_lines = None  # first line of each piece, then the line count
+        self._piece_headings = None  # position of the first heading of each piece
+        self._span_pieces = None  # (first span numbers, piece indexes) sorted
+
+    @property
+    def text(self):
+        '''The source text, None when it was not kept. An edited document
+        keeps its source in self.lines, or in pieces in zero copy mode,
+        which are joined here.'''
+        if self._pieces is None:
+            return self._text
+        if not self.zero_copy:
+            return '\n'.join(self.lines)
+        return '\n'.join([piece.source() for piece in self._pieces if piece.lines])
+
+    @text.setter
+    def text(self, text):
+        self._text = text
+
+    @property
+    def parent(self):
+        '''The Org or node given as parent, or this Org if none was'''
+        if self._parent is None:
+            return self
+        return self._parent()
+
+    @parent.setter
+    def parent(self, parent):
+        # weak, a Drawer's Org has the document as its parent
+        self._parent = None if parent is None or parent is self else ref(parent)
+
+    def close(self):
+        '''Drop the tree and everything kept with it, leaving an empty
+        document. Nodes that nothing else refers to are freed at once, the
+        others are no longer part of the document and in zero copy mode can
+        no longer read their text.'''
+        self._setup(self.parser, self._parent and self._parent())
+
+    def create_target_id(self, target):
+        index = len(self.targets) + 1
+        target_id = f'target-{index}-{slugify(target.target_text)}'
+        self.targets[target.target_text] = target
+        return target_id
+        
+    def __str__(self):
+        return 'Org(' + ' '.join([str(child) for child in self.children]) + ')'
+
+    def span(self, node):
+        '''(start line, start column, end line, end column) of the source of
+        node, counted from 0 with the end not included. Block nodes end at
+        column 0 of the line after their last line. None for nodes that the
+        parser did not build, such as inline markup and source block lines.'''
+        index = self._get_span_index()
+        i = index.get(id(node))
+        if i is None:
+            return None
+        line, col, end_line, end_col = self._span_at(i)
+        start = (line, col)
+        end = (end_line, end_col)
+        whole_lines = end_col == 0
+        # only the node's own lines are stored, it runs on to the end of its
+        # last child
+        while isinstance(node, Node) and not isinstance(node, CodeBlock):
+            if isinstance(node, Heading) and node.drawers:
+                # a drawer may come after the heading's last child
+                for drawer in node.drawers.values():
+                    end = max(end, self._span_at(index.get(id(drawer)))[2:])
+            if not node.children:
+                break
+            node = node.children[-1]
+            i = index.get(id(node))
+            if i is None:
+                break
+            end = max(end, self._span_at(i)[2:])
+        if whole_lines and end[1]:
+            end = (end[0] + 1, 0)
+        return start + end
+
+    def _get_span_index(self):
+        if self._span_index is None:
+            self._span_index = {id(spanned): i for i, spanned in enumerate(self._span_nodes)
+                                if spanned is not None}
+        return self._span_index
+
+    def _get_line_starts(self):
+        if self._line_starts is None:
+            self._line_starts = _line_starts(self._text)
+        return self._line_starts
+
+    def _span_at(self, index):
+        '''The span numbered index in the lines of the document'''
+        line, col, end_line, end_col = self._spans[index * 4:index * 4 + 4]
+        if self._pieces is not None:
+            k = self._span_piece(index)
+            shift = self._get_piece_lines()[k] - self._pieces[k].raw
+            line += shift
+            end_line += shift
+        return line, col, end_line, end_col
+
+    def _span_source(self, index):
+        '''The text that the lines of span index are numbered in, and the
+        offsets of its lines'''
+        if self._pieces is None:
+            return self._text, self._get_line_starts()
+        piece = self._pieces[self._span_piece(index)]
+        return piece.text, piece.get_starts()
+
+    def _span_text(self, index):
+        '''Slice of the source under the span numbered index'''
+        line, col, end_line, end_col = self._spans[index * 4:index * 4 + 4]
+        text, starts = self._span_source(index)
+        return text[starts[line] + col:starts[end_line] + end_col]
+
+    def _title_text(self, index):
+        '''Title of the heading line that starts the span numbered index'''
+        line = self._spans[index * 4]
+        text, starts = self._span_source(index)
+        source = text[starts[line]:_line_end(text, starts, line)]
+        return self.parser.regexps['heading'].match(source).group('title')
+
+    def _block_text(self, index, count):
+        '''The count source lines after the first line of a span'''
+        if not count:
+            return ''
+        line = self._spans[index * 4]
+        text, starts = self._span_source(index)
+        return text[starts[line + 1]:_line_end(text, starts, line + count)]
+
+    def node_at(self, line, col=0):
+        '''The innermost node whose span holds line and column, None if no
+        node does. Inline markup is not split out, the text holding it is
+        returned.'''
+        spans = self._spans
+
+        def key(i):
+            return spans[i * 4], spans[i * 4 + 1]
+
+        if self._pieces is None:
+            i = bisect_right(range(len(self._span_nodes)), (line, col), key=key) - 1
+            if i < 0:
+                return None
+        else:
+            # the last span that starts at or before line and column, it is
+            # in an earlier piece when none in the piece of the line does
+            firsts = self._get_piece_lines()
+            k = bisect_right(firsts, line, 0, len(self._pieces)) - 1
+            while True:
+                if k < 0:
+                    return None
+                piece = self._pieces[k]
+                found = bisect_right(piece.spans, (line - firsts[k] + piece.raw, col), key=key)
+                if found:
+                    i = piece.spans[found - 1]
+                    break
+                k -= 1
+        node = self._span_nodes[i]
+        while node is not None and node is not self:
+            start_line, start_col, end_line, end_col = self.span(node)
+            if (line, col) < (end_line, end_col):
+                return node
+            node = node.parent
+        return None
+
+    def reparse(self, start, end, text):
+        '''Replace source lines start to end (end not included) with the lines
+        of text and rebuild only the innermost heading subtree around them
+        that can be parsed on its own, falling back to the whole document.
+        text is split into lines as by str.splitlines(), so '' deletes the
+        lines, 'x' and 'x\\n' are both the one line x and '\\n' is one
+        empty line. The edited source is kept in self.lines, in zero copy
+        mode in pieces, and self.text is put together from it when read.
+        Only the records of the rebuilt subtree are touched, the ones after
+        it keep their numbers and are moved with the piece they are in.
+        Returns the list of nodes that replaced the old subtree.'''
+        if self._pieces is None:
+            if self._text is None and self.lines is None:
+                raise ValueError('source text was not retained, cannot reparse')
+            if self.lines is None and not self.zero_copy:
+                self.lines = self._text.splitlines()
+        self._get_pieces()
+        if not 0 <= start <= end <= self._get_piece_lines()[-1]:
+            raise IndexError(f'line range {start}:{end} outside of document')
+        new_lines = text.splitlines()
+        for section in self._enclosing_sections(start, end):
+            a, b, last, parent, old_index, old_count, depth = section
+            lines = self._source_lines(a, start) + new_lines + self._source_lines(end, b)
+            if (parent is self and a == 0 and b == self._get_piece_lines()[-1]
+                    and old_count == len(self.children)):
+                # whole document, errors are the caller's
+                root = self._parse_detached(lines, self.strict)
+                break
+            # a tolerant parse would hide that the section is not whole
+            try:
+                root = self._parse_detached(lines, True)
+            except NestingNotValidError:
+                continue
+            if (self._section_fits(root.children, parent, depth, last)
+                    and not self._skips_past(root, last)):
+                break
+        limits = self.parser.limits
+        if limits is not None and limits.max_nodes is not None:
+            self._check_node_total(a, b, root, limits.max_nodes, start)
+        nodes = root.children
+        parent.children[old_index:old_index + old_count] = nodes
+        for node in nodes:
+            node.parent = parent
+        if not self.zero_copy:
+            self.lines[start:end] = new_lines
+            self._text = None
+        delta = len(new_lines) - (end - start)
+        self.diagnostics = (
+            [d for d in self.diagnostics if d.line <= a] +
+            [Diagnostic(d.line + a, d.message) for d in root.diagnostics] +
+            [Diagnostic(d.line + delta, d.message) for d in self.diagnostics if d.line > b])
+        self._splice(a, b, lines, root)
+        live = len(self._span_nodes) - self._dead_spans
+        if self._dead_spans > live or len(self._pieces) > 64 + live // 64:
+            self._compact()
+        return nodes
+
+    def _check_node_total(self, a, b, root, max_nodes, start):
+        '''Raise LimitExceededError, before anything changes, if replacing the
+        nodes of source lines a:b with those of root makes the document hold
+        more than max_nodes nodes. A piece only has records of live nodes.'''
+        pieces = self._pieces[self._split_at(a):self._split_at(b)]
+        removed = sum(len(piece.spans) for piece in pieces)
+        total = len(self._span_nodes) - self._dead_spans - removed + len(root._span_nodes)
+        if total > max_nodes:
+            raise LimitExceededError(
+                'max_nodes', str(Diagnostic(start + 1, f'document of {total} nodes, '
+                                                       f'the limit is {max_nodes}')))
+
+    def _get_pieces(self):
+        '''The pieces of the document, one for all of it before the first edit'''
+        if self._pieces is None:
+            text = starts = None
+            if self.zero_copy:
+                # the source moves to the piece, the Org puts it together
+                text = self._text
+                starts = self._get_line_starts()
+                lines = len(starts) - (text == '' or text.endswith('\n'))
+                self._text = None
+                self._line_starts = None
+            else:
+                lines = len(self.lines)
+            self._pieces = [_Piece(lines, 0, range(len(self._span_nodes)),
+                                   range(len(self._headings)), range(len(self._target_lines)),
+                                   text, starts)]
+            self._drop_piece_tables()
+        return self._pieces
+
+    def _get_piece_lines(self):
+        if self._piece_lines is None:
+            self._piece_lines = array('l', accumulate([piece.lines for piece in self._pieces],
+                                                      initial=0))
+        return self._piece_lines
+
+    def _get_piece_headings(self):
+        if self._piece_headings is None:
+            self._piece_headings = array(
+                'l', accumulate([len(piece.headings) for piece in self._pieces], initial=0))
+        return self._piece_headings
+
+    def _span_piece(self, index):
+        '''Index of the piece that span number index belongs to'''
+        if self._span_pieces is None:
+            order = sorted((piece.spans.start, k) for k, piece in enumerate(self._pieces)
+                           if piece.spans)
+            self._span_pieces = (array('l', [first for first, k in order]),
+                                 array('l', [k for first, k in order]))
+        firsts, pieces = self._span_pieces
+        return pieces[bisect_right(firsts, index) - 1]
+
+    def _heading(self, position):
+        '''(line number, heading, parsed outside of any block) of the heading
+        at position in document order'''
+        firsts = self._get_piece_headings()
+        k = bisect_right(firsts, position, 0, len(self._pieces)) - 1
+        piece = self._pieces[k]
+        lineno, heading, clean = self._headings[piece.headings[position - firsts[k]]]
+        return lineno + self._get_piece_lines()[k] - piece.raw, heading, clean
+
+    def _source_lines(self, start, end):
+        '''Source lines start to end of the document'''
+        if not self.zero_copy:
+            return self.lines[start:end]
+        lines = []
+        firsts = self._get_piece_lines()
+        k = bisect_right(firsts, start, 0, len(self._pieces)) - 1
+        while start < end:
+            piece = self._pieces[k]
+            stop = min(end, firsts[k + 1])
+            if stop > start:
+                text, starts = piece.text, piece.get_starts()
+                raw = piece.raw - firsts[k]
+                lines.extend(text[starts[start + raw]:_line_end(text, starts, stop - 1 + raw)]
+                             .split('\n'))
+                start = stop
+            k += 1
+        return lines
+
+    def _enclosing_sections(self, start, end):
+        '''Yield the sections that contain lines start to end, innermost first,
+        as (a, b, last, parent, old_index, old_count, depth). Lines a:b are
+        the section source, last the position of the heading after it,
+        parent.children[old_index:old_index + old_count] its nodes and depth
+        the depth of its heading.'''
+        heading_at = self._heading
+        count = self._get_piece_headings()[-1]
+        total = self._get_piece_lines()[-1]
+        index = bisect_right(range(count), start, key=lambda i: heading_at(i)[0])
+        depth = None
+        for i in range(index - 1, -1, -1):
+            a, heading, clean = heading_at(i)
+            if depth is not None and heading.depth >= depth:
+                continue
+            depth = heading.depth
+            j = i + 1
+            while j < count and heading_at(j)[1].depth > depth:
+                j += 1
+            b = heading_at(j)[0] if j < count else total
+            if end <= b and clean and (j == count or heading_at(j)[2]):
+                parent = heading.parent
+                yield a, b, j, parent, parent.children.index(heading), 1, depth
+            if heading.parent is self:
+                break  # no heading holds one at the top of the document
+        if count:
+            a, heading, clean = heading_at(0)
+            if end <= a and clean:
+                yield 0, a, 0, self, 0, self.children.index(heading), None
+        yield 0, total, count, self, 0, len(self.children), None
+
+    def _parse_detached(self, lines, strict):
+        '''Parse lines into new top level nodes without touching the tree,
+        returns an Org holding the nodes and their records'''
+        root = self.parser._document(None)
+        self.parser._build(self, root, lines, strict)
+        return root
+
+    def _section_fits(self, nodes, parent, depth, last):
+        '''Check that nodes parsed from a section attach to parent just as in
+        a full parse, and that the heading after the section still lands where
+        it did. A heading section may only yield headings no deeper than the
+        one it replaces, or they would nest under its previous sibling.'''
+        if depth is not None:
+            for node in nodes:
+                if not isinstance(node, Heading) or node.depth > depth:
+                    return False
+                if parent is not self and node.depth <= parent.depth:
+                    return False
+        if (nodes and isinstance(nodes[-1], Heading) and last < self._get_piece_headings()[-1]
+                and nodes[-1].depth < self._heading(last)[1].depth):
+            return False
+        return True
+
+    def _skips_past(self, root, last):
+        '''Check whether an excluded subtree that was still being skipped at
+        the end of a section would have gone on over the heading after it'''
+        return (root._skip_depth is not None and last < self._get_piece_headings()[-1]
+                and self._heading(last)[1].depth > root._skip_depth)
+
+    def _split_at(self, line):
+        '''Index of the first piece that starts at line, the piece holding
+        line is cut in two there when none does'''
+        firsts = self._get_piece_lines()
+        k = bisect_left(firsts, line)
+        if firsts[k] == line:
+            return k
+        k -= 1
+        piece = self._pieces[k]
+        cut = line - firsts[k]
+        raw = piece.raw + cut
+        spans, headings, targets = self._spans, self._headings, self._target_lines
+        i = bisect_left(piece.spans, raw, key=lambda i: spans[i * 4])
+        j = bisect_left(piece.headings, raw, key=lambda i: headings[i][0])
+        t = bisect_left(piece.targets, raw, key=lambda i: targets[i][0])
+        starts = None if piece.text is None else piece.get_starts()  # shared by both halves
+        self._pieces[k:k + 1] = [
+            _Piece(cut, piece.raw, piece.spans[:i], piece.headings[:j], piece.targets[:t],
+                   piece.text, starts),
+            _Piece(piece.lines - cut, raw, piece.spans[i:], piece.headings[j:], piece.targets[t:],
+                   piece.text, starts)]
+        self._drop_piece_tables()
+        return k + 1
+
+    def _splice(self, a, b, lines, root):
+        '''Replace the pieces of source lines a:b with a piece for lines, the
+        new source of a:b, holding the records of root'''
+        first = self._split_at(a)
+        last = self._split_at(b)
+        pieces = self._pieces
+        names = self._get_target_names()
+        changed = set()  # target names whose node may have changed
+        span_index = self._span_index
+        for piece in pieces[first:last]:
+            for i in piece.spans:
+                if span_index is not None:
+                    span_index.pop(id(self._span_nodes[i]), None)
+                self._span_nodes[i] = None  # frees the node
+            self._dead_spans += len(piece.spans)
+            for i in piece.headings:
+                self._headings[i] = None
+            for i in piece.targets:
+                name = self._target_lines[i][1]
+                names[name].discard(i)
+                changed.add(name)
+                self._target_lines[i] = None
+        base = len(self._span_nodes)
+        self._spans.extend(root._spans)
+        self._span_nodes.extend(root._span_nodes)
+        for i, node in enumerate(root._span_nodes, base):
+            if span_index is not None:
+                span_index[id(node)] = i
+            if self.zero_copy and getattr(node, '_span', None) is not None:
+                node._span += base
+        heading_base = len(self._headings)
+        self._headings.extend(root._headings)
+        target_base = len(self._target_lines)
+        self._target_lines.extend(root._target_lines)
+        for i, (lineno, name, node) in enumerate(root._target_lines, target_base):
+            names.setdefault(name, set()).add(i)
+            changed.add(name)
+        pieces[first:last] = [_Piece(
+            len(lines), 0, range(base, len(self._span_nodes)),
+            range(heading_base, len(self._headings)), range(target_base, len(self._target_lines)),
+            '\n'.join(lines) if self.zero_copy else None)]
+        self._drop_piece_tables()
+        # the last target of a name in the document wins, as in a full parse
+        for name in changed:
+            if names[name]:
+                record = max(names[name], key=self._target_order)
+                self.targets[name] = self._target_lines[record][2]
+            else:
+                del names[name]
+                self.targets.pop(name, None)
+
+    def _get_target_names(self):
+        if self._target_names is None:
+            self._target_names = {}
+            for i, record in enumerate(self._target_lines):
+                if record is not None:
+                    self._target_names.setdefault(record[1], set()).add(i)
+        return self._target_names
+
+    def _target_order(self, record):
+        '''Sort key putting target record numbers in document order'''
+        for k, piece in enumerate(self._pieces):
+            if record in piece.targets:
+                return k, record
+
+    def _compact(self):
+        '''Put the live records in document order and in the lines of the
+        document, as one piece, dropping the records of replaced pieces'''
+        spans = array('l')
+        span_nodes = []
+        headings = []
+        target_lines = []
+        firsts = self._get_piece_lines()
+        for k, piece in enumerate(self._pieces):
+            shift = firsts[k] - piece.raw
+            for i in piece.spans:
+                line, col, end_line, end_col = self._spans[i * 4:i * 4 + 4]
+                spans.extend((line + shift, col, end_line + shift, end_col))
+                span_nodes.append(self._span_nodes[i])
+            for i in piece.headings:
+                lineno, heading, clean = self._headings[i]
+                headings.append((lineno + shift, heading, clean))
+            for i in piece.targets:
+                lineno, name, node = self._target_lines[i]
+                target_lines.append((lineno + shift, name, node))
+        text = None
+        if self.zero_copy:
+            text = self.text
+            for i, node in enumerate(span_nodes):
+                if getattr(node, '_span', None) is not None:
+                    node._span = i
+        self._spans = spans
+        self._span_nodes = span_nodes
+        self._headings = headings
+        self._target_lines = target_lines
+        self._pieces = [_Piece(firsts[-1], 0, range(len(span_nodes)), range(len(headings)),
+                               range(len(target_lines)), text)]
+        self._dead_spans = 0
+        self._target_names = None
+        self._span_index = None
+        self._drop_piece_tables()
+
+    def append(self, child):
+        self.children.append(child)
+        child._parent = ref(self)
+
+    def resolve_links(self):
+        # one walk for the heading map and the links, a loop rather than
+        # nested recursive functions, which would hold the document in a
+        # reference cycle
+        heading_map = {}
+        links = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Heading):
+                heading_map[node.title] = f"#{slugify(node.title)}"
+            elif isinstance(node, InternalLink):
+                links.append(node)
+            elif isinstance(node, CodeBlock):
+                continue  # only source text inside
+            if isinstance(node, Node) or node is self:
+                stack.extend(reversed(node.children))
+
+        # Resolve links
+        for node in links:
+            # start over, the tree may have been edited since the last run
+            node.anchor = node.link_text
+            node.resolved = False
+            if node.anchor in self.targets:
+                node.resolved = True
+            elif node.anchor in heading_map:
+                node.anchor = heading_map[node.anchor][1:]
+                node.resolved = True
+            # Else: stays unresolved, renders as text
+
+    def html(self, br=''):
+        self.resolve_links()  # Run before rendering
+        return br.join([child.html(br) for child in self.children])
+
+
+class LineRule(object):
+    '''A line rule added to a Parser. pattern is matched at the start of the
+    line, triggers are the characters that the lines it matches start with
+    after any indent, or whole prefixes for lines starting with '#', such as
+    '#+TITLE:'. handler(builder, m, line, lineno) is called with the match and
+    adds the nodes for the line with builder.add_node() or builder.current.'''
+
+    def __init__(self, name, pattern, triggers, handler):
+        self.name = name
+        self.regexp = compile(pattern)
+        self.triggers = tuple(triggers)
+        self.handler = handler
+
+
+class Parser(object):
+    '''Turns org text into Org documents. A parser only holds configuration,
+    the state of a parse lives in a _Builder made for it, so one parser can
+    be shared between threads.'''
     regexps = {
         'whiteline': compile(Syntax.WHITELINE),
         'heading': compile(Syntax.HEADING),
@@ -497,123 +1596,750 @@ class Org(object):
         'unorderedlist': compile(Syntax.UNORDERED_LIST),
         'definitionlist': compile(Syntax.DEF_LIST),
         'tablerow': compile(Syntax.TABLE_ROW),
+        'drawer_begin': compile(Syntax.DRAWER_BEGIN),
+        'drawer_end': compile(Syntax.DRAWER_END),
         'internal_link': compile(Syntax.INTERNAL_LINK),
         'target': compile(Syntax.TARGET),
     }
+    # line rules in priority order, the 'regex' engine tries every one of these
+    line_rules = ('heading', 'internal_link', 'blockquote_begin', 'blockquote_end',
+                  'src_begin', 'src_end', 'orderedlist', 'definitionlist',
+                  'unorderedlist', 'tablerow', 'drawer_begin')
+    # the 'fast' engine picks candidate rules from the first non-space character
+    line_dispatch = {
+        '*': ('heading',),
+        '[': ('internal_link',),
+        '-': ('unorderedlist',),
+        '+': ('unorderedlist',),
+        '|': ('tablerow',),
+        ':': ('drawer_begin',),
+    }
+    # rules that only match at column zero
+    column_zero_rules = ('heading', 'internal_link')
+    keyword_rules = (
+        ('#+BEGIN_QUOTE', 'blockquote_begin'),
+        ('#+END_QUOTE', 'blockquote_end'),
+        ('#+BEGIN_SRC', 'src_begin'),
+        ('#+END_SRC', 'src_end'),
+    )
+    engines = ('fast', 'regex')
+    # headings whose subtrees are left out with skip_excluded, as in an export
+    exclude_keywords = ('COMMENT',)
+    exclude_tags = ('ARCHIVE', 'noexport')
+
+    # line breaks other than \n that str.splitlines() splits on
+    line_breaks = compile('[\r\v\f\x1c\x1d\x1e\x85\u2028\u2029]')
+
+    def __init__(self, default_heading=1, engine='fast', coalesce=None, rules=None,
+                 strict=True, zero_copy=False, skip_excluded=False, extra_rules=(),
+                 limits=None):
+        if engine not in self.engines:
+            raise ValueError(f'unknown engine {engine!r}, expected one of {self.engines}')
+        extra_rules = tuple(extra_rules)
+        names = self.line_rules + tuple(rule.name for rule in extra_rules)
+        if len(set(names)) < len(names):
+            raise ValueError(f'line rule names must be unique, got {names}')
+        if rules is None:
+            rules = names
+        unknown = [rule for rule in rules if rule not in names]
+        if unknown:
+            raise ValueError(f'unknown line rules {unknown}, expected some of {names}')
+        self.default_heading = default_heading
+        self.engine = engine
+        # one Text per paragraph instead of one per line, the fast engine's default
+        if coalesce is None:
+            coalesce = engine == 'fast'
+        self.coalesce = coalesce
+        # raise NestingNotValidError on unbalanced blocks, or close or skip
+        # them and note each one in the document's diagnostics
+        self.strict = strict
+        # text nodes, heading titles and source blocks keep a span of the
+        # retained source instead of their own strings
+        self.zero_copy = zero_copy
+        # read past the subtrees of COMMENT headings and of headings tagged
+        # :ARCHIVE: or :noexport: without building anything for them
+        self.skip_excluded = skip_excluded
+        # a Limits for untrusted text, LimitExceededError when one is passed
+        self.limits = limits
+        # the rule tables with the added rules after the built in ones, cut
+        # down to the enabled rules, lines that only match a disabled rule
+        # are read as text
+        self.regexps = dict(self.regexps)
+        handlers = dict(_Builder.rule_handlers)
+        line_dispatch = {first: list(candidates)
+                         for first, candidates in self.line_dispatch.items()}
+        keyword_rules = list(self.keyword_rules)
+        for rule in extra_rules:
+            self.regexps[rule.name] = rule.regexp
+            handlers[rule.name] = rule.handler
+            for trigger in rule.triggers:
+                if trigger.startswith('#'):
+                    keyword_rules.append((trigger, rule.name))
+                else:
+                    line_dispatch.setdefault(trigger[0], []).append(rule.name)
+        self.line_rules = tuple(rule for rule in names if rule in rules)
+        self.handlers = {rule: handlers[rule] for rule in self.line_rules if rule in handlers}
+        self.line_dispatch = {
+            first: tuple(rule for rule in candidates if rule in rules)
+            for first, candidates in line_dispatch.items()}
+        # indented lines never match the column zero rules
+        self._indented_dispatch = {
+            first: tuple(rule for rule in candidates if rule not in self.column_zero_rules)
+            for first, candidates in self.line_dispatch.items()}
+        self.keyword_rules = tuple(
+            (prefix, rule) for prefix, rule in keyword_rules if rule in rules)
+        self._definitionlist = ('definitionlist',) if 'definitionlist' in rules else ()
+        self._orderedlist = ('orderedlist',) if 'orderedlist' in rules else ()
+
+    def _line_matcher(self):
+        '''The line matching method of the engine, for a parse to keep, the
+        parser does not keep it itself as that would make it a cycle'''
+        if self.engine == 'fast':
+            return self._dispatch_line
+        return self._cascade_line
+
+    def parse(self, text, parent=None):
+        '''Parse org text into a new Org'''
+        org = self._document(parent)
+        self._parse_text(org, text)
+        return org
+
+    def parse_lines(self, lines, parent=None):
+        '''Parse an iterable of lines into a new Org, consuming one line at a
+        time. Lines may keep their line endings, the source text is not
+        retained unless the parser is zero copy.'''
+        org = self._document(parent)
+        if self.zero_copy:
+            lines = list(self._split_chunks(lines))
+            org.text = '\n'.join(lines)
+            self._build(org, org, lines)
+        else:
+            self._build(org, org, self._split_chunks(lines))
+        return org
+
+    def parse_file(self, fileobj, parent=None, encoding='utf-8'):
+        '''Parse an open file into a new Org line by line, lines read from a
+        binary file are decoded with encoding'''
+        lines = (line.decode(encoding) if isinstance(line, bytes) else line
+                 for line in fileobj)
+        return self.parse_lines(lines, parent)
+
+    def parse_parallel(self, text, parent=None, processes=None, chunk_lines=None,
+                       executor=None):
+        '''Parse org text into a new Org, splitting it at top level headings
+        and parsing the pieces in a pool of processes, executor if given or
+        a ProcessPoolExecutor of processes workers. The Org is the one
+        parse() would build. Pieces hold about chunk_lines lines, by
+        default enough for four pieces a worker.
+        The text is parsed in this process when it has no split that keeps
+        the pieces independent, and with limits, which count per document.
+        Added line rules and their handlers must be picklable.'''
+        lines = text.splitlines()
+        if processes is None:
+            processes = getattr(executor, '_max_workers', None) or os.cpu_count() or 1
+        if chunk_lines is None:
+            chunk_lines = max(1000, len(lines) // (4 * processes))
+        ranges = self._top_level_ranges(text, lines, chunk_lines)
+        if len(ranges) < 2 or self.limits is not None:
+            return self.parse(text, parent)
+        # the collector would walk the unpickled nodes over and over while
+        # they arrive, they hold no garbage
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            if executor is None:
+                with ProcessPoolExecutor(processes) as executor:
+                    results = self._parse_ranges(executor, lines, ranges)
+            else:
+                results = self._parse_ranges(executor, lines, ranges)
+        finally:
+            if collecting:
+                gc.enable()
+        if self.strict and any(chunk.diagnostics for chunk, _ in results):
+            return self.parse(text, parent)  # raises at the first problem
+        org = self._document(parent)
+        self._text_lines(org, text)
+        for (start, _), (chunk, _) in zip(ranges, results):
+            self._adopt(org, chunk, start)
+        return org
+
+    def _top_level_ranges(self, text, lines, chunk_lines):
+        '''Split the line numbers of text into (start, end) ranges of at least
+        chunk_lines lines, each later range starting at a top level heading
+        outside of source blocks'''
+        if 'heading' not in self.line_rules:
+            return [(0, len(lines))]
+        if self.line_breaks.search(text):
+            text = '\n'.join(lines)  # outline() counts lines split at \n only
+        ranges = []
+        start = 0
+        for depth, _, _, line, _ in outline(text, slugs=False):
+            if depth == 1 and line - start >= chunk_lines:
+                ranges.append((start, line))
+                start = line
+        ranges.append((start, len(lines)))
+        return ranges
+
+    def _parse_ranges(self, executor, lines, ranges):
+        '''Parse each range of lines on its own, joining a range with the next
+        one while it ends inside a quote that its last heading did not close,
+        returns a (root, open) pair for each range left'''
+        results = [None] * len(ranges)
+        while True:
+            todo = [i for i, result in enumerate(results) if result is None]
+            chunks = [lines[ranges[i][0]:ranges[i][1]] for i in todo]
+            for i, result in zip(todo, executor.map(_parse_chunk, [self] * len(todo), chunks)):
+                results[i] = result
+            for i in range(len(ranges) - 1):
+                if results[i][1]:
+                    ranges[i:i + 2] = [(ranges[i][0], ranges[i + 1][1])]
+                    results[i:i + 2] = [None]
+                    break
+            else:
+                return results
+
+    def _adopt(self, org, chunk, start):
+        '''Move the nodes and records of a piece parsed on its own, from line
+        start of the text, to the end of org'''
+        for node in chunk.children:
+            node.parent = org
+        org.children.extend(chunk.children)
+        base = len(org._span_nodes)
+        for node in chunk._span_nodes:
+            node.org_root = org
+            if self.zero_copy and getattr(node, '_span', None) is not None:
+                node._span += base
+        spans = chunk._spans
+        for i in range(0, len(spans), 4):
+            spans[i] += start
+            spans[i + 2] += start
+        org._spans.extend(spans)
+        org._span_nodes.extend(chunk._span_nodes)
+        org._headings.extend(
+            (lineno + start, heading, clean) for lineno, heading, clean in chunk._headings)
+        org._target_lines.extend(
+            (lineno + start, target, node) for lineno, target, node in chunk._target_lines)
+        org.targets.update(chunk.targets)
+        org.diagnostics.extend(
+            Diagnostic(diagnostic.line + start, diagnostic.message)
+            for diagnostic in chunk.diagnostics)
+        org._skip_depth = chunk._skip_depth
+
+    async def parse_async(self, source, parent=None, yield_every=1000, progress=None,
+                          encoding='utf-8'):
+        '''Parse org text, an iterable of lines or an async iterable of lines,
+        such as an asyncio.StreamReader, into a new Org, giving control back
+        to the event loop after every yield_every lines. progress, if given,
+        is called then with the number of lines read and the total number
+        of lines, None for streams. Cancelling the task stops the parse at
+        the next pause, with asyncio.CancelledError.'''
+        org = self._document(parent)
+        builder = _Builder(self, org, org, self.strict)
+        total = None
+        kept = None  # lines of a stream, for the source text in zero copy mode
+        if isinstance(source, str):
+            lines = self._text_lines(org, source)
+            total = len(lines)
+        elif hasattr(source, '__aiter__'):
+            lines = self._split_async(source, encoding)
+        else:
+            lines = self._split_chunks(
+                line.decode(encoding) if isinstance(line, bytes) else line for line in source)
+        if total is None and self.zero_copy:
+            kept = []
+        lineno = 0
+        if hasattr(lines, '__aiter__'):
+            async for line in lines:
+                builder.parse_line(line, lineno)
+                lineno += 1
+                if kept is not None:
+                    kept.append(line)
+                if not lineno % yield_every:
+                    await self._pause(progress, lineno, total)
+        else:
+            for line in lines:
+                builder.parse_line(line, lineno)
+                lineno += 1
+                if kept is not None:
+                    kept.append(line)
+                if not lineno % yield_every:
+                    await self._pause(progress, lineno, total)
+        builder.finish()
+        if kept is not None:
+            org.text = '\n'.join(kept)
+        if progress is not None:
+            progress(lineno, total)
+        return org
+
+    @staticmethod
+    async def _pause(progress, lineno, total):
+        if progress is not None:
+            progress(lineno, total)
+        await asyncio.sleep(0)
+
+    @staticmethod
+    async def _split_async(chunks, encoding):
+        async for chunk in chunks:
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode(encoding)
+            if not chunk:
+                yield chunk
+                continue
+            for line in chunk.splitlines():
+                yield line
+
+    def _parse_text(self, org, text):
+        self._build(org, org, self._text_lines(org, text))
+
+    def _text_lines(self, org, text):
+        '''Keep text as the source of org, returns its lines'''
+        lines = text.splitlines()
+        if self.zero_copy and self.line_breaks.search(text):
+            # spans count lines split at \n only
+            text = '\n'.join(lines)
+        org.text = text
+        return lines
+
+    def _document(self, parent):
+        org = Org.__new__(Org)
+        org._setup(self, parent)
+        return org
+
+    def _build(self, org, root, lines, strict=None):
+        '''Parse lines into the children of root, nodes belong to org'''
+        if strict is None:
+            strict = self.strict
+        builder = _Builder(self, org, root, strict)
+        for lineno, line in enumerate(lines):
+            builder.parse_line(line, lineno)
+        builder.finish()
+
+    def _cascade_line(self, line):
+        '''Try every line rule in order, returns (rule, match) or (None, None)'''
+        for rule in self.line_rules:
+            m = self.regexps[rule].match(line)
+            if m:
+                return rule, m
+        return None, None
+
+    def _dispatch_line(self, line):
+        '''Choose the line rule from the leading characters of the line and
+        run only that rule's regex, returns (rule, match) or (None, None)'''
+        if not line:
+            return None, None
+        first = line[0]
+        if first == '#':
+            for prefix, rule in self.keyword_rules:
+                if line.startswith(prefix):
+                    m = self.regexps[rule].match(line)
+                    if m:
+                        return rule, m
+            return None, None
+        if first.isspace():
+            first = line.lstrip()[:1]
+            rules = self._indented_dispatch.get(first, ())
+        else:
+            rules = self.line_dispatch.get(first, ())
+        if (first == '-' or first == '+') and '::' in line:
+            rules = self._definitionlist + rules
+        elif first.isdecimal():
+            # before any added rule triggered on the digit, as in line_rules
+            rules = self._orderedlist + rules
+        for rule in rules:
+            m = self.regexps[rule].match(line)
+            if m:
+                return rule, m
+        return None, None
+
+    def _is_excluded(self, title):
+        '''Check for a heading title that starts with an exclude keyword or
+        ends with an exclude tag'''
+        words = title.split()
+        if not words:
+            return False
+        if words[0] in self.exclude_keywords:
+            return True
+        last = words[-1]
+        if len(last) > 2 and last[0] == ':' and last[-1] == ':':
+            for tag in last[1:-1].split(':'):
+                if tag in self.exclude_tags:
+                    return True
+        return False
 
-    def __init__(self, text, default_heading=1, parent=None):
-        self.text = text
-        self.children = []
-        if parent is None:
-            self.parent = self
+    @staticmethod
+    def _split_chunks(lines):
+        for chunk in lines:
+            if not chunk:
+                yield chunk
+                continue
+            # same line boundaries as str.splitlines() on the whole text
+            yield from chunk.splitlines()
+
+
+class _Builder(object):
+    '''The state of a single parse, adds the nodes read from each line to root'''
+
+    def __init__(self, parser, org, root, strict=True):
+        self.parser = parser
+        self.regexps = parser.regexps
+        self.match_line = parser._line_matcher()
+        self.org = org  # the document the nodes belong to
+        self.root = root
+        self.strict = strict
+        self.zero_copy = parser.zero_copy
+        self.handlers = parser.handlers
+        self.limits = parser.limits
+        self.deadline = None
+        if self.limits is not None and self.limits.max_seconds is not None:
+            self.deadline = time.monotonic() + self.limits.max_seconds
+        self.current = root
+        self.bquote_flg = False
+        self.src_flg = False
+        # depth of the excluded heading whose subtree is being skipped
+        self.skip_level = None
+        self.skip_src_flg = False
+        # the drawer being read and its lines, dropped for ordinary lines if
+        # a heading or the end comes before its :END:
+        self.drawer = None
+        self.drawer_lines = None
+        self.drawer_lineno = None
+        # set while the lines of an abandoned drawer are read again, none of
+        # them can open a drawer that ends, there is no :END: among them
+        self.replaying = False
+        # line numbers of the last block openings
+        self.bquote_lineno = None
+        self.src_lineno = None
+        # Text of the paragraph being read and its lines, joined when it ends
+        self._run_text = None
+        self._run_lines = None
+        # spans of the nodes in document order, each covering only the node's
+        # own lines, Org.span() adds the lines of its children
+        self.span_nodes = []
+        self.spans = []
+        self._quote_spans = {}  # open quote to its span number
+        self._src_span = None
+        self._table_span = None
+        self._run_span = None
+
+    def finish(self):
+        while self.drawer is not None:
+            self._abandon_drawer()
+        if self._run_lines is not None:
+            self._end_run()
+        if self.src_flg:
+            self._nesting_error(self.src_lineno, '#+BEGIN_SRC is never closed')
+            self.src_flg = False
+            self.current.close()
+            self._end_span(self._src_span, self.src_lineno + 1 + self.current.line_count)
+            self.current = self.current.parent
+        if self.bquote_flg:
+            self._nesting_error(self.bquote_lineno, '#+BEGIN_QUOTE is never closed')
+            self.bquote_flg = False
+        if self.skip_src_flg:
+            # no heading would end the skip inside the source block
+            self.root._skip_depth = float('-inf')
+        elif self.skip_level is not None:
+            self.root._skip_depth = self.skip_level + self.parser.default_heading - 1
+        self.root._span_nodes = self.span_nodes
+        self.root._spans = array('l', self.spans)
+
+    def _add_span(self, node, line, col, end_line, end_col):
+        '''Record where node is in the source, returns its span number'''
+        if self.limits is not None:
+            self._check_node(node, line)
+        self.span_nodes.append(node)
+        self.spans.extend((line, col, end_line, end_col))
+        return len(self.span_nodes) - 1
+
+    def _limit_error(self, lineno, limit, message):
+        raise LimitExceededError(limit, str(Diagnostic(lineno + 1, message)))
+
+    def _check_line(self, line, lineno):
+        limits = self.limits
+        if limits.max_line_length is not None and len(line) > limits.max_line_length:
+            self._limit_error(lineno, 'max_line_length',
+                              f'{len(line)} characters, the limit is {limits.max_line_length}')
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self._limit_error(lineno, 'max_seconds',
+                              f'parse took over {limits.max_seconds} seconds')
+
+    def _check_node(self, node, lineno):
+        limits = self.limits
+        if limits.max_nodes is not None and len(self.span_nodes) >= limits.max_nodes:
+            self._limit_error(lineno, 'max_nodes', f'over {limits.max_nodes} nodes')
+        if limits.max_depth is not None:
+            depth = 0
+            while node is not None and not isinstance(node, Org):
+                depth += 1
+                if depth > limits.max_depth:
+                    self._limit_error(lineno, 'max_depth',
+                                      f'nodes nested over {limits.max_depth} deep')
+                node = node.parent
+
+    def _end_span(self, index, line):
+        '''Let a block node run to the end of line - 1'''
+        self.spans[index * 4 + 2] = line
+        self.spans[index * 4 + 3] = 0
+
+    def _nesting_error(self, lineno, message):
+        '''Raise NestingNotValidError, or in tolerant mode record the problem
+        and let the caller recover'''
+        diagnostic = Diagnostic(None if lineno is None else lineno + 1, message)
+        if self.strict:
+            raise NestingNotValidError(str(diagnostic))
+        self.root.diagnostics.append(diagnostic)
+
+    def parse_line(self, line, lineno):
+        if self.limits is not None:
+            self._check_line(line, lineno)
+        if self.skip_level is not None and self._skip_line(line):
+            return
+        if self.drawer is not None and self._drawer_line(line, lineno):
+            return
+        if self.src_flg and not self.regexps['src_end'].match(line):
+            if self.zero_copy:
+                self.current.line_count += 1
+            else:
+                self.current.add_line(line)
+            return
+        rule, m = self.match_line(line)
+        self._parse_matched(rule, m, line, lineno)
+
+    def _parse_matched(self, rule, m, line, lineno):
+        if rule == 'drawer_begin':
+            owner = None if self.replaying else self._drawer_owner(m)
+            if owner is not None:
+                # nothing changes until the :END: line shows it is a drawer
+                self.drawer = Drawer(self.org, m.group('name'), owner)
+                self.drawer_lines = [line]
+                self.drawer_lineno = lineno
+                return
+            rule = None
+        if self._run_lines is not None:
+            if rule is None and line and self.current is self._run_text.parent:
+                self._run_lines.append(line)
+                self._check_target(line, lineno)
+                return
+            self._end_run()
+        if rule is not None:
+            self.handlers[rule](self, m, line, lineno)
+        elif not line:
+            if isinstance(self.current, Paragraph):
+                self.current = self.current.parent
+        elif (not isinstance(self.current, Heading) and isinstance(self.current, Node)):
+            self._add_text(line, lineno)
+            self._check_target(line, lineno)
         else:
-            self.parent = parent
-        self.current = self
+            node = Paragraph(org_root=self.org)
+            self.current.append(node)
+            self._add_span(node, lineno, 0, lineno + 1, 0)
+            self.current = node
+            self._add_text(line, lineno)
+
+    # handlers of the built in line rules, each is called with the match of
+    # its rule once the paragraph being read has been ended
+
+    def _on_heading(self, m, line, lineno):
+        if (self.parser.skip_excluded and not self.bquote_flg
+                and self.parser._is_excluded(m.group('title'))):
+            self.skip_level = len(m.group('level'))
+            return
+        while (not isinstance(self.current, Heading) and
+               not isinstance(self.current, Org)):
+            self.current = self.current.parent
+        heading = Heading(
+            org_root=self.org,
+            depth=len(m.group('level')),
+            title=None if self.zero_copy else m.group('title'),
+            default_depth=self.parser.default_heading)
+        self._add_heading_node(heading)
+        span = self._add_span(heading, lineno, 0, lineno + 1, 0)
+        if self.zero_copy:
+            heading._span = span
+        self.root._headings.append((lineno, heading, not self.bquote_flg))
+
+    def _on_internal_link(self, m, line, lineno):
+        node = InternalLink(self.org, m.group('anchor'), m.group('title'))
+        self.current.append(node)
+        self._add_span(node, lineno, 0, lineno, m.end())
+
+    def _on_blockquote_begin(self, m, line, lineno):
+        self.bquote_flg = True
+        self.bquote_lineno = lineno
+        node = Blockquote(org_root=self.org, cite=m.group('cite'))
+        self.current.append(node)
+        self._quote_spans[id(node)] = self._add_span(node, lineno, 0, lineno + 1, 0)
+        self.current = node
+
+    def _on_blockquote_end(self, m, line, lineno):
+        if not self.bquote_flg:
+            self._nesting_error(lineno, '#+END_QUOTE without #+BEGIN_QUOTE')
+            return
         self.bquote_flg = False
+        node = self.current
+        while not isinstance(node, Blockquote):
+            if isinstance(node, Org):
+                # a heading has closed the quote already
+                self._nesting_error(lineno, '#+END_QUOTE outside of its quote')
+                return
+            node = node.parent
+        self._end_span(self._quote_spans.pop(id(node)), lineno + 1)
+        self.current = node.parent
+
+    def _on_src_begin(self, m, line, lineno):
+        self.src_flg = True
+        self.src_lineno = lineno
+        node = CodeBlock(org_root=self.org, src_type=m.group('src_type'))
+        self.current.append(node)
+        self._src_span = self._add_span(node, lineno, 0, lineno + 1, 0)
+        if self.zero_copy:
+            node._span = self._src_span
+        self.current = node
+
+    def _on_src_end(self, m, line, lineno):
+        if not self.src_flg:
+            self._nesting_error(lineno, '#+END_SRC without #+BEGIN_SRC')
+            return
         self.src_flg = False
-        self.default_heading = default_heading
-        self.targets = {}  # Map of <<target>> to nodes
-        self._parse(self.text)
+        self.current.close()
+        self._end_span(self._src_span, lineno + 1)
+        self.current = self.current.parent
 
-    def create_target_id(self, target):
-        index = len(self.targets) + 1
-        target_id = f'target-{index}-{slugify(target.target_text)}'
-        self.targets[target.target_text] = target
-        return target_id
-        
-    def __str__(self):
-        return 'Org(' + ' '.join([str(child) for child in self.children]) + ')'
+    def _on_orderedlist(self, m, line, lineno):
+        while isinstance(self.current, Paragraph):
+            self.current = self.current.parent
+        self._add_olist_node(m, lineno)
+
+    def _on_definitionlist(self, m, line, lineno):
+        while isinstance(self.current, Paragraph):
+            self.current = self.current.parent
+        self._add_dlist_node(m, lineno)
+
+    def _on_unorderedlist(self, m, line, lineno):
+        while isinstance(self.current, Paragraph):
+            self.current = self.current.parent
+        self._add_ulist_node(m, lineno)
+
+    def _on_tablerow(self, m, line, lineno):
+        self._add_tablerow(m, lineno)
+
+    def add_node(self, node, lineno, enter=False):
+        '''Append node to the current node, recording the whole line as its
+        source, for the handlers of added line rules. With enter the node
+        becomes the current node.'''
+        while isinstance(self.current, Paragraph):
+            self.current = self.current.parent
+        self.current.append(node)
+        self._add_span(node, lineno, 0, lineno + 1, 0)
+        if enter:
+            self.current = node
+
+    def _drawer_owner(self, m):
+        '''The heading a drawer line opens a drawer in, None if the line is
+        only text: :END:, a line in a quote or one before the first heading'''
+        if self.bquote_flg or m.group('name').upper() == 'END':
+            return None
+        node = self.current
+        while not isinstance(node, Heading):
+            if isinstance(node, Org):
+                return None
+            node = node.parent
+        return node
+
+    def _drawer_line(self, line, lineno):
+        '''Collect a line of the open drawer, returns False for a heading
+        line or a #+BEGIN_SRC line, which the drawer cannot hold. Headings are
+        then found from the source blocks alone, as outline() finds them'''
+        if ((line.startswith('*') and self.regexps['heading'].match(line))
+                or (line.startswith('#+BEGIN_SRC') and self.regexps['src_begin'].match(line))):
+            while self.drawer is not None:
+                self._abandon_drawer()
+            return False
+        if not self.regexps['drawer_end'].match(line):
+            self.drawer_lines.append(line)
+            return True
+        drawer = self.drawer
+        lines = self.drawer_lines
+        self.drawer = None
+        self.drawer_lines = None
+        if self._run_lines is not None:
+            self._end_run()
+        while isinstance(self.current, Paragraph):
+            self.current = self.current.parent
+        if drawer.name in drawer.parent.drawers:
+            return True
+        drawer.parent.drawers[drawer.name] = drawer
+        drawer.line_count = len(lines) - 1
+        span = self._add_span(drawer, self.drawer_lineno, 0, lineno + 1, 0)
+        if self.zero_copy:
+            drawer._span = span
+        else:
+            drawer._lines = lines[1:]
+        return True
+
+    def _abandon_drawer(self):
+        '''Read the lines of a drawer that never ended as ordinary lines'''
+        lines = self.drawer_lines
+        lineno = self.drawer_lineno
+        self.drawer = None
+        self.drawer_lines = None
+        self._parse_matched(None, None, lines[0], lineno)
+        self.replaying = True
+        for offset, line in enumerate(lines[1:], 1):
+            self.parse_line(line, lineno + offset)
+        self.replaying = False
+
+    def _skip_line(self, line):
+        '''Skip the lines of an excluded subtree up to the next heading at
+        the same or a higher level, headings in source blocks do not count'''
+        if self.skip_src_flg:
+            if self.regexps['src_end'].match(line):
+                self.skip_src_flg = False
+            return True
+        if line.startswith('#+BEGIN_SRC'):
+            self.skip_src_flg = self.regexps['src_begin'].match(line) is not None
+            return True
+        if line.startswith('*'):
+            m = self.regexps['heading'].match(line)
+            if m and len(m.group('level')) <= self.skip_level:
+                self.skip_level = None
+                return False
+        return True
+
+    def _add_text(self, line, lineno):
+        text = Text(self.org, None if self.zero_copy else line)
+        self.current.append(text)
+        span = self._add_span(text, lineno, 0, lineno, len(line))
+        if self.zero_copy:
+            text._span = span
+        if self.parser.coalesce and isinstance(self.current, Paragraph):
+            self._run_span = span
+            self._run_text = text
+            self._run_lines = [line]
+
+    def _end_run(self):
+        '''Give the paragraph's Text all of the lines read into it'''
+        if len(self._run_lines) > 1:
+            if not self.zero_copy:
+                self._run_text.value = '\n'.join(self._run_lines)
+                self._run_text.values = None
+            i = self._run_span * 4
+            self.spans[i + 2] = self.spans[i] + len(self._run_lines) - 1
+            self.spans[i + 3] = len(self._run_lines[-1])
+        self._run_text = None
+        self._run_lines = None
+
+    def _check_target(self, line, lineno):
+        '''Register the paragraph as the target named in a continuation line'''
+        if '[[#' in line and self.regexps['internal_link'].search(line):  # Inline links
+            return
+        if '<<' in line:  # Inline target
+            m = self.regexps['target'].search(line)
+            if m:
+                self.root.targets[m.group('target')] = self.current
+                if lineno is not None:
+                    self.root._target_lines.append((lineno, m.group('target'), self.current))
 
-    def _parse(self, text):
-        text = text.splitlines()
-        for line in text:
-            if self.src_flg and not self.regexps['src_end'].match(line):
-                self.current.append(Text(self, line, noparse=True))
-                continue
-            if self.regexps['heading'].match(line):
-                m = self.regexps['heading'].match(line)
-                while (not isinstance(self.current, Heading) and
-                       not isinstance(self.current, Org)):
-                    self.current = self.current.parent
-                self._add_heading_node(Heading(
-                    org_root=self,
-                    depth=len(m.group('level')),
-                    title=m.group('title'),
-                    default_depth=self.default_heading))
-            elif self.regexps['internal_link'].match(line):
-                m = self.regexps['internal_link'].match(line)
-                node = InternalLink(self, m.group('anchor'), m.group('title'))
-                self.current.append(node)
-            elif self.regexps['target'].match(line) and False:
-                m = self.regexps['target'].match(line)
-                target = m.group('target')
-                node = Text(self, target)  # Could be a custom Target node if needed
-                self.current.append(node)
-                self.targets[target] = node  # Store for resolution
-                node.is_target = True
-            elif self.regexps['blockquote_begin'].match(line):
-                self.bquote_flg = True
-                m = self.regexps['blockquote_begin'].match(line)
-                node = Blockquote(org_root=self, cite=m.group('cite'))
-                self.current.append(node)
-                self.current = node
-            elif self.regexps['blockquote_end'].match(line):
-                if not self.bquote_flg:
-                    raise NestingNotValidError
-                self.bquote_flg = False
-                while not isinstance(self.current, Blockquote):
-                    if isinstance(self.current, Org):
-                        raise NestingNotValidError
-                    self.current = self.current.parent
-                self.current = self.current.parent
-            elif self.regexps['src_begin'].match(line):
-                self.src_flg = True
-                m = self.regexps['src_begin'].match(line)
-                node = CodeBlock(org_root=self, src_type=m.group('src_type'))
-                self.current.append(node)
-                self.current = node
-            elif self.regexps['src_end'].match(line):
-                if not self.src_flg:
-                    raise NestingNotValidError
-                self.src_flg = False
-                self.current = self.current.parent
-            elif self.regexps['orderedlist'].match(line):
-                while isinstance(self.current, Paragraph):
-                    self.current = self.current.parent
-                m = self.regexps['orderedlist'].match(line)
-                self._add_olist_node(m)
-            elif self.regexps['definitionlist'].match(line):
-                while isinstance(self.current, Paragraph):
-                    self.current = self.current.parent
-                m = self.regexps['definitionlist'].match(line)
-                self._add_dlist_node(m)
-            elif self.regexps['unorderedlist'].match(line):
-                while isinstance(self.current, Paragraph):
-                    self.current = self.current.parent
-                m = self.regexps['unorderedlist'].match(line)
-                self._add_ulist_node(m)
-            elif self.regexps['tablerow'].match(line):
-                m = self.regexps['tablerow'].match(line)
-                self._add_tablerow(m)
-            elif not line:
-                if isinstance(self.current, Paragraph):
-                    self.current = self.current.parent
-            elif (not isinstance(self.current, Heading) and isinstance(self.current, Node)):
-                if self.regexps['internal_link'].search(line):  # Inline links
-                    self.current.append(Text(self, line))  # Let TerminalNode parse it
-                elif self.regexps['target'].search(line):  # Inline target
-                    self.current.append(Text(self, line))
-                    m = self.regexps['target'].search(line)
-                    self.targets[m.group('target')] = self.current
-                else:
-                    self.current.append(Text(self, line))
-            else:
-                node = Paragraph(org_root=self)
-                self.current.append(node)
-                self.current = node
-                self.current.append(Text(self, line))
-        if self.bquote_flg or self.src_flg:
-            raise NestingNotValidError
 
     def _is_deeper(self, cls, depth):
         if isinstance(self.current, cls):
@@ -634,87 +2360,330 @@ class Org(object):
         self.current.append(heading)
         self.current = heading
 
-    def _add_list_node(self, m, listclass=List):
+    def _add_list_node(self, m, lineno, listclass=List):
         is_listclass = isinstance(self.current, listclass)
         depth = len(m.group('depth'))
         if self._is_deeper(listclass, depth) or not is_listclass:
-            listnode = listclass(org_root=self, depth=len(m.group('depth')))
+            listnode = listclass(org_root=self.org, depth=len(m.group('depth')))
             self.current.append(listnode)
+            self._add_span(listnode, lineno, 0, lineno + 1, 0)
             self.current = listnode
         while self._is_shallower(listclass, depth):
             self.current = self.current.parent
-        self.current.append(ListItem(self, m.group('item')))
+        item = ListItem(self.org, None if self.zero_copy else m.group('item'))
+        self.current.append(item)
+        span = self._add_span(item, lineno, m.start('item'), lineno, m.end('item'))
+        if self.zero_copy:
+            item._span = span
 
-    def _add_olist_node(self, m):
-        self._add_list_node(m, listclass=OrderedList)
+    def _add_olist_node(self, m, lineno):
+        self._add_list_node(m, lineno, listclass=OrderedList)
 
-    def _add_ulist_node(self, m):
-        self._add_list_node(m, listclass=UnOrderedList)
+    def _add_ulist_node(self, m, lineno):
+        self._add_list_node(m, lineno, listclass=UnOrderedList)
 
-    def _add_dlist_node(self, m):
+    def _add_dlist_node(self, m, lineno):
         is_definitionlist = isinstance(self.current, DefinitionList)
         depth = len(m.group('depth'))
         if self._is_deeper(DefinitionList, depth) or not is_definitionlist:
-            listnode = DefinitionList(org_root=self, depth=len(m.group('depth')))
+            listnode = DefinitionList(org_root=self.org, depth=len(m.group('depth')))
             self.current.append(listnode)
+            self._add_span(listnode, lineno, 0, lineno + 1, 0)
             self.current = listnode
         while (isinstance(self.current, DefinitionList) and
                len(m.group('depth')) < self.current.depth):
             self.current = self.current.parent
-        self.current.append(
-            DefinitionListItem(self, m.group('item'), m.group('desc')))
-
-    def _add_tablerow(self, m):
-        cells = [c for c in m.group('cells').split('|') if c != '']
+        if self.zero_copy:
+            item = DefinitionListItem(self.org, None, None)
+        else:
+            item = DefinitionListItem(self.org, m.group('item'), m.group('desc'))
+        self.current.append(item)
+        self._add_span(item, lineno, 0, lineno + 1, 0)
+        title, description = item.children
+        title_span = self._add_span(title, lineno, m.start('item'), lineno, m.end('item'))
+        description_span = self._add_span(description, lineno, m.start('desc'), lineno, m.end('desc'))
+        if self.zero_copy:
+            title._span = title_span
+            description._span = description_span
+
+    def _add_tablerow(self, m, lineno):
+        row = m.group('cells')
         if not isinstance(self.current, Table):
-            tablenode = Table(org_root=self)
+            tablenode = Table(org_root=self.org)
             self.current.append(tablenode)
+            self._table_span = self._add_span(tablenode, lineno, 0, lineno + 1, 0)
             self.current = tablenode
-        rownode = TableRow(org_root=self)
+        if row.startswith('-') and not row.strip('-+| '):
+            # |---+---| separator row
+            self._end_span(self._table_span, lineno + 1)
+            return
+        rownode = TableRow(org_root=self.org)
         self.current.append(rownode)
-        self.current = rownode
-        for cell in cells:
-            cellnode = TableCell(org_root=self)
-            self.current.append(cellnode)
-            self.current = cellnode
-            self._parse(cell)
-            self.current = self.current.parent
-        self.current = self.current.parent
-
-    def append(self, child):
-        self.children.append(child)
-        child.parent = self
-
-    def resolve_links(self):
-        # Build heading map
-        heading_map = {}
-        def collect_headings(node):
-            if isinstance(node, Heading):
-                heading_map[node.title] = f"#{slugify(node.title)}"
-            if isinstance(node, Node) or node == self:
-                for child in node.children:
-                    collect_headings(child)
-        collect_headings(self)
+        self._add_span(rownode, lineno, 0, lineno + 1, 0)
+        col = m.start('cells')
+        for cell in row.split('|'):
+            if cell != '':
+                cellnode = TableCell(org_root=self.org)
+                rownode.append(cellnode)
+                self._add_span(cellnode, lineno, col, lineno, col + len(cell))
+                self._add_cell(cellnode, cell, lineno, col)
+            col += len(cell) + 1
+
+    def _add_cell(self, cellnode, cell, lineno, col):
+        '''A cell holds a single line of inline text, so skip the block rules'''
+        if cell.startswith('[[#'):
+            m = self.regexps['internal_link'].match(cell)
+            if m:
+                node = InternalLink(self.org, m.group('anchor'), m.group('title'))
+                cellnode.append(node)
+                self._add_span(node, lineno, col, lineno, col + m.end())
+                return
+        text = Text(self.org, None if self.zero_copy else cell)
+        cellnode.append(text)
+        span = self._add_span(text, lineno, col, lineno, col + len(cell))
+        if self.zero_copy:
+            text._span = span
+        if '<<' in cell and not ('[[#' in cell and self.regexps['internal_link'].search(cell)):
+            m = self.regexps['target'].search(cell)
+            if m:
+                self.root.targets[m.group('target')] = cellnode
+                if lineno is not None:
+                    self.root._target_lines.append((lineno, m.group('target'), cellnode))
+
+    # the handler of each built in line rule, Parser compiles its own table
+    # from these and the handlers of its added rules
+    rule_handlers = {
+        'heading': _on_heading,
+        'internal_link': _on_internal_link,
+        'blockquote_begin': _on_blockquote_begin,
+        'blockquote_end': _on_blockquote_end,
+        'src_begin': _on_src_begin,
+        'src_end': _on_src_end,
+        'orderedlist': _on_orderedlist,
+        'definitionlist': _on_definitionlist,
+        'unorderedlist': _on_unorderedlist,
+        'tablerow': _on_tablerow,
+    }
 
-        # Resolve links
-        def resolve_node(node):
-            if isinstance(node, InternalLink):
-                if node.anchor in self.targets:
-                    node.resolved = True
-                elif node.anchor in heading_map:
-                    node.anchor = heading_map[node.anchor][1:]
-                    node.resolved = True
-                # Else: stays unresolved, renders as text
-            if isinstance(node, Node) or node == self:
-                for child in node.children:
-                    resolve_node(child)
-        resolve_node(self)
-
-    def html(self, br=''):
-        self.resolve_links()  # Run before rendering
-        return br.join([child.html(br) for child in self.children])
 
 def org_to_html(text, default_heading=1, newline=''):
     return Org(text, default_heading).html(newline)
 
 
+async def parse_async(source, default_heading=1, yield_every=1000, progress=None,
+                      encoding='utf-8', **kwargs):
+    '''Parse org text or a stream of lines without blocking the event loop
+    for long, see Parser.parse_async. Other keyword arguments go to Parser.'''
+    parser = Parser(default_heading, **kwargs)
+    return await parser.parse_async(source, yield_every=yield_every, progress=progress,
+                                    encoding=encoding)
+
+
+def parse_parallel(text, default_heading=1, processes=None, chunk_lines=None,
+                   executor=None, **kwargs):
+    '''Parse the top level sections of org text in a pool of processes, see
+    Parser.parse_parallel. Other keyword arguments go to Parser.'''
+    parser = Parser(default_heading, **kwargs)
+    return parser.parse_parallel(text, processes=processes, chunk_lines=chunk_lines,
+                                 executor=executor)
+
+
+def _parse_chunk(parser, lines):
+    '''Parse a piece of a document in a worker, tolerant so that the caller
+    sees the problems, returns the root and whether a quote is still open'''
+    root = parser._document(None)
+    builder = _Builder(parser, root, root, False)
+    for lineno, line in enumerate(lines):
+        builder.parse_line(line, lineno)
+    while builder.drawer is not None:
+        builder._abandon_drawer()  # as the heading after the piece would
+    quote_open = builder.bquote_flg or builder.src_flg
+    builder.finish()
+    return root, quote_open
+
+
+def iterparse(source, default_heading=1):
+    '''Parse org text, or an iterable of lines, into a stream of
+    (event, payload) tuples without building a tree:
+
+    heading_start, heading_end -- (depth, title)
+    paragraph_line -- the line
+    list_item -- (depth, item, description), description is None unless
+        the item is in a definition list, depth is the item indent
+    table_row -- list of cell strings
+    quote_start -- cite or None, quote_end -- None
+    src_start -- src type or None, src_line -- the line, src_end -- None
+    drawer_start -- the name, drawer_line -- the line, drawer_end -- None,
+        for every drawer, Heading.drawers keeps the first of each name
+    link -- (url, title) for every link in paragraph lines, list items and
+        table cells, internal links give '#' + anchor as the url
+
+    The events of a drawer come when its :END: line is read, its lines are
+    held until then and read as ordinary lines if a heading, #+BEGIN_SRC
+    or the end comes first, as the parser does. Apart from those lines only
+    the open headings are kept.
+    '''
+    if isinstance(source, str):
+        lines = source.splitlines()
+    else:
+        lines = Parser._split_chunks(source)
+    parser = Parser(default_heading)
+    regexps = parser.regexps
+    headings = []  # (depth, title) of the open headings
+    bquote_flg = False
+    src_flg = False
+    drawer = None  # lines of the drawer that has not ended yet
+
+    def line_events(line, replaying=False):
+        nonlocal bquote_flg, src_flg, drawer
+        if src_flg and not regexps['src_end'].match(line):
+            yield 'src_line', line
+            return
+        rule, m = parser._dispatch_line(line)
+        if rule == 'drawer_begin':
+            if (headings and not bquote_flg and not replaying
+                    and m.group('name').upper() != 'END'):
+                drawer = [line]
+                return
+            rule = None
+        if rule == 'heading':
+            depth = len(m.group('level')) + default_heading - 1
+            while headings and headings[-1][0] >= depth:
+                yield 'heading_end', headings.pop()
+            headings.append((depth, m.group('title')))
+            yield 'heading_start', headings[-1]
+        elif rule == 'internal_link':
+            yield 'link', ('#' + m.group('anchor'), m.group('title'))
+        elif rule == 'blockquote_begin':
+            bquote_flg = True
+            yield 'quote_start', m.group('cite')
+        elif rule == 'blockquote_end':
+            if not bquote_flg:
+                raise NestingNotValidError
+            bquote_flg = False
+            yield 'quote_end', None
+        elif rule == 'src_begin':
+            src_flg = True
+            yield 'src_start', m.group('src_type')
+        elif rule == 'src_end':
+            if not src_flg:
+                raise NestingNotValidError
+            src_flg = False
+            yield 'src_end', None
+        elif rule == 'orderedlist' or rule == 'unorderedlist':
+            yield 'list_item', (len(m.group('depth')), m.group('item'), None)
+            yield from _iter_links(m.group('item'))
+        elif rule == 'definitionlist':
+            yield 'list_item', (len(m.group('depth')), m.group('item'), m.group('desc'))
+            yield from _iter_links(m.group('item'))
+            yield from _iter_links(m.group('desc'))
+        elif rule == 'tablerow':
+            row = m.group('cells')
+            if row.startswith('-') and not row.strip('-+| '):
+                return
+            cells = [c.strip() for c in row.split('|') if c != '']
+            yield 'table_row', cells
+            for cell in cells:
+                yield from _iter_links(cell)
+        elif line:
+            yield 'paragraph_line', line
+            yield from _iter_links(line)
+
+    def abandon_drawer():
+        nonlocal drawer
+        held = drawer
+        drawer = None
+        for held_line in held:
+            yield from line_events(held_line, True)
+
+    for line in lines:
+        if drawer is not None:
+            if ((line.startswith('*') and regexps['heading'].match(line))
+                    or (line.startswith('#+BEGIN_SRC') and regexps['src_begin'].match(line))):
+                yield from abandon_drawer()
+            elif regexps['drawer_end'].match(line):
+                yield 'drawer_start', regexps['drawer_begin'].match(drawer[0]).group('name')
+                for held_line in drawer[1:]:
+                    yield 'drawer_line', held_line
+                yield 'drawer_end', None
+                drawer = None
+                continue
+            else:
+                drawer.append(line)
+                continue
+        yield from line_events(line)
+    if drawer is not None:
+        yield from abandon_drawer()
+    if bquote_flg or src_flg:
+        raise NestingNotValidError
+    while headings:
+        yield 'heading_end', headings.pop()
+
+
+def _iter_links(text):
+    if '[[' not in text:
+        return
+    for m in TerminalNode.regexps['link'].finditer(text):
+        yield 'link', (m.group('url'), m.group('subject'))
+    if '[[#' in text:
+        for m in Parser.regexps['internal_link'].finditer(text):
+            yield 'link', ('#' + m.group('anchor'), m.group('title'))
+
+
+# lines that can start a heading or a source block, the parser's own
+# regexps decide whether they do
+_OUTLINE_CANDIDATE = r'^(?:\*|#\+(?:BEGIN|END)_SRC)[^\n]*'
+_outline_candidates = compile(_OUTLINE_CANDIDATE, MULTILINE)
+_outline_candidates_bytes = compile(_OUTLINE_CANDIDATE.encode(), MULTILINE)
+
+
+def outline(source, default_heading=1, slugs=True):
+    '''Scan org text, str or UTF-8 bytes, for its headings without parsing
+    anything else. Returns a list of (depth, title, slug, line, offset)
+    tuples in document order, line is the 0 based line number and offset
+    the position of the line in source, in bytes when source is bytes or
+    another buffer such as an mmap.
+    Headings inside source blocks are skipped, lines end with \\n or \\r\\n.
+    Slugs take most of the time, with slugs=False the slug is None.'''
+    is_bytes = not isinstance(source, str)
+    if is_bytes:
+        candidates = _outline_candidates_bytes
+        newline = b'\n'
+        if hasattr(source, 'count'):
+            count = source.count
+        else:
+            # an mmap has no count(), slices of it are bytes
+            def count(sub, start, end):
+                return source[start:end].count(sub)
+    else:
+        candidates = _outline_candidates
+        newline = '\n'
+        count = source.count
+    regexps = Parser.regexps
+    heading, src_begin, src_end = regexps['heading'], regexps['src_begin'], regexps['src_end']
+    entries = []
+    src_flg = False
+    line = 0
+    counted = 0  # line is the line number of offset counted
+    for m in candidates.finditer(source):
+        text = m.group()
+        if is_bytes:
+            text = text.decode('utf-8', 'replace')
+        if text.endswith('\r'):
+            text = text[:-1]
+        if src_flg:
+            if src_end.match(text):
+                src_flg = False
+            continue
+        if text[0] == '#':
+            src_flg = src_begin.match(text) is not None
+            continue
+        h = heading.match(text)
+        if h:
+            offset = m.start()
+            line += count(newline, counted, offset)
+            counted = offset
+            title = h.group('title')
+            depth = len(h.group('level')) + default_heading - 1
+            entries.append((depth, title, slugify(title) if slugs else None, line, offset))
+    return entries
@@ -0,0 +1,154 @@
+# pyorg2/section_index.py
+import json
+import mmap
+import os
+from pathlib import Path
+from .org import Org, outline
+
+INDEX_VERSION = 1
+
+
+class Section:
+    '''One heading subtree of an indexed file, start and end are the byte
+    offsets of its source, end is where the next heading of the same or a
+    higher level starts'''
+
+    def __init__(self, level, title, slug, path, start, end, line):
+        self.level = level
+        self.title = title
+        self.slug = slug
+        self.path = path  # titles of the headings from the top down to this one
+        self.start = start
+        self.end = end
+        self.line = line
+
+    def __repr__(self):
+        return f'Section({self.path!r}, {self.start}:{self.end})'
+
+
+class SectionIndex:
+    '''Byte ranges of the heading subtrees of an org file, kept in a sidecar
+    file next to it (file.org.idx by default) so that one subtree of a huge
+    file can be parsed without reading the rest. The sidecar is rebuilt
+    when the size or mtime of the file no longer match it.'''
+
+    def __init__(self, file_path, index_path=None, default_heading=1):
+        self.file_path = Path(file_path)
+        if not self.file_path.is_file():
+            raise FileNotFoundError(f"{self.file_path} is not a valid file")
+        if index_path is None:
+            index_path = self.file_path.with_name(self.file_path.name + '.idx')
+        self.index_path = Path(index_path)
+        self.default_heading = default_heading
+        self.size = None
+        self.mtime_ns = None
+        self.sections = []
+        self._by_path = {}
+        self._by_slug = {}
+        self.refresh()
+
+    def refresh(self):
+        '''Load the sidecar, or rebuild it if the file changed since it was
+        written. Returns True when the index was rebuilt.'''
+        stat = self.file_path.stat()
+        if (stat.st_size, stat.st_mtime_ns) == (self.size, self.mtime_ns):
+            return False
+        records = self._load(stat)
+        rebuilt = records is None
+        if rebuilt:
+            records = self._scan()
+            self._save(stat, records)
+        self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+        self._set_sections(records)
+        return rebuilt
+
+    def _load(self, stat):
+        try:
+            with self.index_path.open('r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if (data.get('version') != INDEX_VERSION or data.get('size') != stat.st_size
+                or data.get('mtime_ns') != stat.st_mtime_ns):
+            return None
+        return data['sections']
+
+    def _save(self, stat, records):
+        data = {'version': INDEX_VERSION, 'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns, 'sections': records}
+        tmp_path = self.index_path.with_name(self.index_path.name + '.tmp')
+        try:
+            with tmp_path.open('w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError:
+            pass  # the sidecar is only a cache, a read only directory just loses it
+
+    def _scan(self):
+        '''Build [level, title, slug, start, end, line] records from the file'''
+        with self.file_path.open('rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:  # mmap refuses empty files
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                size = len(source)
+                entries = outline(source)
+        records = []
+        open_records = []  # records whose section has not ended yet
+        for level, title, slug, line, offset in entries:
+            while open_records and open_records[-1][0] >= level:
+                open_records.pop()[4] = offset
+            record = [level, title, slug, offset, size, line]
+            records.append(record)
+            open_records.append(record)
+        return records
+
+    def _set_sections(self, records):
+        self.sections = []
+        self._by_path = {}
+        self._by_slug = {}
+        path = []
+        for level, title, slug, start, end, line in records:
+            while path and path[-1][0] >= level:
+                path.pop()
+            path.append((level, title))
+            section = Section(level, title, slug, tuple(t for l, t in path), start, end, line)
+            self.sections.append(section)
+            # the first of several headings with the same path or slug wins
+            self._by_path.setdefault(section.path, section)
+            self._by_slug.setdefault(slug, section)
+
+    def find(self, key):
+        '''Section for a slug, or for a sequence of heading titles from the
+        top heading down, None if there is no such heading'''
+        self.refresh()
+        if isinstance(key, str):
+            return self._by_slug.get(key)
+        return self._by_path.get(tuple(key))
+
+    def read(self, key):
+        '''Source text of a section'''
+        return self._read(self._get(key))
+
+    def _get(self, key):
+        section = self.find(key)
+        if section is None:
+            raise KeyError(key)
+        return section
+
+    def _read(self, section):
+        with self.file_path.open('rb') as f:
+            f.seek(section.start)
+            return f.read(section.end - section.start).decode('utf-8')
+
+    def parse(self, key, default_heading=None, **kwargs):
+        '''Parse only the source of a section into an Org. Headings get the
+        depths they have in a parse of the whole file, or with
+        default_heading the section's own heading gets that depth.
+        Other keyword arguments go to Org.'''
+        section = self._get(key)
+        text = self._read(section)
+        if default_heading is None:
+            default_heading = self.default_heading
+        else:
+            default_heading -= section.level - 1
+        return Org(text, default_heading, **kwargs)
@@ -1,4 +1,28 @@
 import json
+import weakref
+
+
+def _no_ref():
+    return None
+
+
+class WeakLink:
+    """ An attribute that holds its value through a weak reference. The links back up
+    the tree use it, so that a tree has no reference cycles and goes away as soon as
+    its Root is dropped, without waiting for the garbage collector. Reads as None
+    once the object it pointed to is gone.
+    """
+    def __set_name__(self, owner, name):
+        self.name = '_' + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return obj.__dict__[self.name]()
+
+    def __set__(self, obj, value):
+        obj.__dict__[self.name] = _no_ref if value is None else weakref.ref(value)
+
 
 class Root:
     """ The base of the tree. The source designates the first source file or buffer parsed to
@@ -93,6 +117,8 @@ class Branch:
     a bigger tree. So we use the branch concept to make that work. The source designates the
     first file or buffer parsed to produce the tree. Normally this should be a pathlike object.
     """
+    root = WeakLink()
+    parent = WeakLink()
 
     def __init__(self, root, source, parent=None):
         self.root = root
@@ -135,7 +161,9 @@ class Branch:
         return f"(self.node_id) branch from source {self.source}"
     
 class Node:
-    
+    root = WeakLink()
+    parent = WeakLink()
+
     def __init__(self, parent, auto_add=True):
         self.parent = parent
         self.root = self.find_root()
@@ -339,6 +367,7 @@ class LinkTarget():
     it can be the target of a link. It is not a node, but has a reference to the node that
     is the actual target. This is for the various target forms including explicit, including
     the named element form which is implemented in the TargetText class.
+    The node is held weakly, as the node keeps its LinkTargets.
 
     The supported linkable forms include the explicit name form when can proceed
     any element:
@@ -358,6 +387,8 @@ class LinkTarget():
     :CUSTOM_ID: link-to-text
     :END:
     """
+    target_node = WeakLink()
+
     def __init__(self, target_node, target_text):
         self.target_node = target_node
         self.target_text = target_text
@@ -684,6 +715,7 @@ class Link(Container):
 
 
 class InternalLink(Link):
+    target_node = WeakLink()  # the target may hold this link, as an ancestor of it
 
     def __init__(self, *args, **argv):
         super().__init__(*args, **argv)
@@ -1,6 +1,14 @@
+import asyncio
+import gc
+import io
+import os
+import pickle
+import weakref
 import pytest
 from pyorg2.org import (NestingNotValidError, Org, org_to_html, Heading, Paragraph,
-                         UnOrderedList, OrderedList, ListItem, DefinitionList, Text)
+                         UnOrderedList, OrderedList, ListItem, DefinitionList, Text,
+                         iterparse, outline, parse_async, parse_parallel, Parser, LineRule, Node,
+                         Limits, LimitExceededError, _Builder)
 
 # TestOrg class converted to functions
 def test_org():
@@ -12,17 +20,20 @@ def test_paragraph():
     text = '''line1
 line2'''
     o = Org(text)
+    assert str(o) == 'Org(Paragraph(Text))'
+    assert o.children[0].children[0].value == 'line1\nline2'
+    o = Org(text, coalesce=False)
     assert str(o) == 'Org(Paragraph(Text Text))'
 
 def test_paragraph_append_str():
     text = '''line1
 line2'''
     o = Org(text)
-    assert str(o) == 'Org(Paragraph(Text Text))'
+    assert str(o) == 'Org(Paragraph(Text))'
     target = o.children[0]
     target.append("line3")
-    assert isinstance(target.children[2], Text)
-    assert "line3" in target.children[2].get_text()
+    assert isinstance(target.children[1], Text)
+    assert "line3" in target.children[1].get_text()
 
 
 def test_new_paragraph():
@@ -32,6 +43,8 @@ para1-2
 para2-1
 para2-2'''
     o = Org(text)
+    assert str(o) == 'Org(Paragraph(Text) Paragraph(Text))'
+    o = Org(text, coalesce=False)
     assert str(o) == 'Org(Paragraph(Text Text) Paragraph(Text Text))'
 
 def test_heading():
@@ -55,9 +68,10 @@ def test_is_deeper_greater_depth():
     text = '''* Heading1
 ** Heading2'''
     o = Org(text)
-    o.current = o.children[0]  # Set to Heading1
-    assert o._is_deeper(Heading, 2)  # 2 > 1
-    assert not o._is_deeper(Heading, 1)  # 1 == 1
+    builder = _Builder(o.parser, o, o)
+    builder.current = o.children[0]  # Set to Heading1
+    assert builder._is_deeper(Heading, 2)  # 2 > 1
+    assert not builder._is_deeper(Heading, 1)  # 1 == 1
     
 def test_blockquote():
     text = '''#+BEGIN_QUOTE: http://exapmle.com
@@ -367,7 +381,7 @@ quoted
 - hoge
 - fuga
 #+END_QUOTE'''
-    o = Org(text)
+    o = Org(text, coalesce=False)
     assert str(o) == 'Org(Heading1(Paragraph(Text) Heading2(Paragraph(Text Text)) Heading2(Table(TableRow(TableCell(Text) TableCell(Text)) TableRow(TableCell(Text) TableCell(Text))) Heading3(Blockquote(Text UnOrderedList(ListItem ListItem))))))'
 
 # TestOrgToHTML class converted
@@ -574,3 +588,805 @@ some text after the heading <<target2>>
 '''
     o = Org(text)
     print('\n', o.html())
+
+def test_fast_engine_matches_regex_engine():
+    text = '''* header1
+paraparapara <<anchor>>
+** header2-1
+[[image]]
+para*para*2[[http://example.com][hyperlink]]
+  * not a heading
+- item :: description
+- item
+  1. nested
+| a | b |
+#+BEGIN_QUOTE: cite
+quoted
+#+END_QUOTE
+#+BEGIN_SRC python
+- not a list
+#+END_SRC
+[[#anchor][back]]'''
+    fast = Org(text, coalesce=False)
+    regex = Org(text, engine='regex')
+    assert str(fast) == str(regex)
+    assert fast.html() == regex.html()
+    assert list(fast.targets) == list(regex.targets)
+    assert Org(text).html() == regex.html()
+
+def test_dispatch_line():
+    o = Parser()
+    assert o._dispatch_line('* Heading')[0] == 'heading'
+    assert o._dispatch_line('*bold* text') == (None, None)
+    assert o._dispatch_line('  * indented') == (None, None)
+    assert o._dispatch_line('#+BEGIN_SRC python')[0] == 'src_begin'
+    assert o._dispatch_line('#+END_QUOTE')[0] == 'blockquote_end'
+    assert o._dispatch_line('# comment') == (None, None)
+    assert o._dispatch_line('  12) item')[0] == 'orderedlist'
+    assert o._dispatch_line('- term :: desc')[0] == 'definitionlist'
+    assert o._dispatch_line('- term ::')[0] == 'unorderedlist'
+    assert o._dispatch_line(' | a | b |')[0] == 'tablerow'
+    assert o._dispatch_line('') == (None, None)
+    assert o._dispatch_line('plain text') == (None, None)
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        Org('', engine='bogus')
+
+def test_inline_plain_fast_path():
+    value = 'no markup characters in this line'
+    t = Text(None, value)
+    assert t.values == [value]
+
+def test_inline_priority():
+    # code is matched before bold, so the asterisks stay inside the code
+    t = Text(None, 'a *b =c* d= e*')
+    assert t.get_text() == 'a *b InlineCodeText e*'
+    # the url slashes are not taken as italic markup
+    t = Text(None, 'a /b [[https://x.org/y][z]] c/')
+    assert t.get_text() == 'a /b Link c/'
+
+def test_inline_many_markups():
+    text = ' '.join(f'w *b{i}* /i{i}/ =c{i}=' for i in range(200))
+    t = Text(None, text)
+    names = [str(v) for v in t.values if not isinstance(v, str)]
+    assert names.count('BoldText') == 200
+    assert names.count('ItalicText') == 200
+    assert names.count('InlineCodeText') == 200
+
+def test_from_lines_and_file():
+    text = '''* header1
+paraparapara
+** header2
+- hoge
+- fuga
+
+| a | b |
+#+BEGIN_SRC python
+python code
+#+END_SRC'''
+    expected = Org(text)
+    from_lines = Org.from_lines(iter(text.splitlines()))
+    assert from_lines.text is None
+    assert str(from_lines) == str(expected)
+    assert from_lines.html() == expected.html()
+    from_file = Org.from_file(io.StringIO(text + '\n'))
+    assert str(from_file) == str(expected)
+    assert from_file.html() == expected.html()
+    from_binary = Org.from_file(io.BytesIO(text.replace('\n', '\r\n').encode('utf-8')))
+    assert from_binary.html() == expected.html()
+
+def test_from_lines_nesting_error():
+    with pytest.raises(NestingNotValidError):
+        Org.from_lines(['#+BEGIN_SRC\n', 'code\n'])
+
+def test_reparse_section():
+    text = '''* One
+first
+* Two
+second
+** Two.1
+deep
+* Three
+third'''
+    o = Org(text)
+    one, two, three = o.children
+    nodes = o.reparse(3, 4, 'changed *second*\nmore <<t2>>')
+    assert o.children[0] is one
+    assert o.children[2] is three
+    assert o.children[1] is nodes[0]
+    assert o.lines[3:5] == ['changed *second*', 'more <<t2>>']
+    expected = Org('\n'.join(o.lines))
+    assert str(o) == str(expected)
+    assert o.html() == expected.html()
+    assert o.targets['t2'] is nodes[0].children[0]
+
+def test_reparse_new_heading():
+    text = '''* One
+first
+* Two
+second'''
+    o = Org(text)
+    o.reparse(1, 2, 'first\n* Inserted\nbody')
+    assert str(o) == 'Org(Heading1(Paragraph(Text)) Heading1(Paragraph(Text)) Heading1(Paragraph(Text)))'
+    # demoting a heading moves it under the previous one
+    o.reparse(2, 3, '** Inserted')
+    assert str(o) == 'Org(Heading1(Paragraph(Text) Heading2(Paragraph(Text))) Heading1(Paragraph(Text)))'
+
+def test_reparse_targets_removed():
+    text = '''* One
+text
+more <<t1>>
+* Two
+[[#t1][link]]'''
+    o = Org(text)
+    assert '<a href="#t1">link</a>' in o.html()
+    o.reparse(2, 3, 'more')
+    assert 't1' not in o.targets
+    assert o.html() == Org('\n'.join(o.lines)).html()
+
+def test_reparse_nesting_error():
+    o = Org('''* One
+text''')
+    with pytest.raises(NestingNotValidError):
+        o.reparse(1, 2, '#+BEGIN_SRC')
+    assert str(o) == 'Org(Heading1(Paragraph(Text)))'
+
+def test_reparse_text():
+    for zero_copy in (False, True):
+        o = Org('a\nb\nc', zero_copy=zero_copy)
+        o.reparse(1, 2, 'x\n')
+        assert o.text == 'a\nx\nc'
+        # '\n' is one empty line, '' no line at all
+        o.reparse(1, 2, '\n')
+        assert o.text == 'a\n\nc'
+        o.reparse(1, 2, '')
+        assert o.text == 'a\nc'
+        assert str(o) == str(Org('a\nc'))
+
+def test_reparse_needs_source():
+    o = Org.from_lines(['* One'])
+    with pytest.raises(ValueError):
+        o.reparse(0, 1, '* Two')
+
+def test_reparse_many_edits():
+    section = '* Head\ntext <<t>>\n- item\n** Sub\n| a |\n'
+    for zero_copy in (False, True):
+        o = Org(section * 50, zero_copy=zero_copy)
+        last = o.children[-1]
+        span = last._span
+        for step in range(150):
+            line = (step * 37) % 49 * 5 + 1
+            o.reparse(line, line + 1, f'edit {step} <<t{step % 3}>>')
+        # the last section is never edited and keeps its nodes and span numbers
+        assert o.children[-1] is last and last._span == span
+        expected = Org.from_lines(o.text.split('\n') if zero_copy else o.lines)
+        assert str(o) == str(expected)
+        assert o.html() == expected.html()
+        assert sorted(o.targets) == sorted(expected.targets)
+        for name, node in o.targets.items():
+            assert o.span(node) == expected.span(expected.targets[name])
+        for line in range(0, 250, 7):
+            assert o.span(o.node_at(line)) == expected.span(expected.node_at(line))
+        assert o.children[-1].title == 'Head'
+    # a trailing empty line survives the edit
+    o = Org('* a\ntext\n\n', zero_copy=True)
+    o.reparse(1, 2, 'other')
+    assert o.text == '* a\nother\n'
+    assert o.children[0].children[0].children[0].value == 'other'
+
+def test_iterparse():
+    text = '''* header1
+para [[http://example.com][example]]
+** header2
+- item :: desc
+1. first
+| a | [[#anchor][b]] |
+#+BEGIN_SRC python
+* not a heading
+#+END_SRC
+* header3'''
+    events = list(iterparse(text))
+    assert events == [
+        ('heading_start', (1, 'header1')),
+        ('paragraph_line', 'para [[http://example.com][example]]'),
+        ('link', ('http://example.com', 'example')),
+        ('heading_start', (2, 'header2')),
+        ('list_item', (0, 'item', 'desc')),
+        ('list_item', (0, 'first', None)),
+        ('table_row', ['a', '[[#anchor][b]]']),
+        ('link', ('#anchor', 'b')),
+        ('src_start', 'python'),
+        ('src_line', '* not a heading'),
+        ('src_end', None),
+        ('heading_end', (2, 'header2')),
+        ('heading_end', (1, 'header1')),
+        ('heading_start', (1, 'header3')),
+        ('heading_end', (1, 'header3')),
+    ]
+    assert list(iterparse(io.StringIO(text + '\n'))) == events
+
+def test_iterparse_drawers():
+    text = '''* header
+:LOGBOOK:
+CLOCK: [a]
+:END:
+:NOTES:
+never ended
+* next'''
+    assert list(iterparse(text)) == [
+        ('heading_start', (1, 'header')),
+        ('drawer_start', 'LOGBOOK'),
+        ('drawer_line', 'CLOCK: [a]'),
+        ('drawer_end', None),
+        ('paragraph_line', ':NOTES:'),
+        ('paragraph_line', 'never ended'),
+        ('heading_end', (1, 'header')),
+        ('heading_start', (1, 'next')),
+        ('heading_end', (1, 'next')),
+    ]
+    # no drawers before the first heading
+    assert list(iterparse(':X:\n:END:')) == [('paragraph_line', ':X:'), ('paragraph_line', ':END:')]
+
+def test_iterparse_nesting_error():
+    with pytest.raises(NestingNotValidError):
+        list(iterparse('#+END_QUOTE'))
+
+def test_lazy_inline_parse():
+    text = '''* header1
+para*para*
+** header2
+=code='''
+    o = Org(text)
+    texts = [o.children[0].children[0].children[0],
+             o.children[0].children[1].children[0].children[0]]
+    assert all(t._values is None for t in texts)
+    assert [h.title for h in (o.children[0], o.children[0].children[1])] == ['header1', 'header2']
+    assert all(t._values is None for t in texts)
+    assert texts[0].get_text() == 'paraBoldText'
+    assert texts[0]._values is not None
+    assert texts[1]._values is None
+    assert o.html() == '<h1>header1</h1><p>para<span style="font-weight: bold;">para</span></p><h2>header2</h2><p><code>code</code></p>'
+    assert texts[1]._values is not None
+
+def test_table_separator_and_cells():
+    text = '''| head1 | head2 |
+|-------+-------|
+| *bold* | - not a list |
+| <<cell-target>> | * not a heading |'''
+    o = Org(text)
+    assert str(o) == 'Org(Table(TableRow(TableCell(Text) TableCell(Text)) TableRow(TableCell(Text) TableCell(Text)) TableRow(TableCell(Text) TableCell(Text))))'
+    assert o.html() == '<table><tr><td>head1</td><td>head2</td></tr><tr><td><span style="font-weight: bold;">bold</span></td><td>- not a list</td></tr><tr><td><<cell-target>></td><td>* not a heading</td></tr></table>'
+    assert o.targets['cell-target'] is o.children[0].children[2].children[0]
+
+def test_table_in_blockquote():
+    text = '''#+BEGIN_QUOTE
+| a | b |
+#+END_QUOTE'''
+    o = Org(text)
+    assert str(o) == 'Org(Blockquote(Table(TableRow(TableCell(Text) TableCell(Text)))))'
+
+def test_src_body_buffer():
+    text = '''#+BEGIN_SRC python
+def f():   
+    return *x*
+
+#+END_SRC'''
+    o = Org(text)
+    block = o.children[0]
+    assert block._children is None
+    assert block.body == 'def f():   \n    return *x*\n'
+    assert str(o) == 'Org(CodeBlock(Text Text Text))'
+    assert o.html('\n') == '<pre><code class="python">def f():\n    return *x*\n</code></pre>'
+    assert block._children is None
+    assert [t.get_text() for t in block.children] == ['def f():   ', '    return *x*', '']
+    assert o.html('\n') == '<pre><code class="python">def f():\n    return *x*\n</code></pre>'
+
+def test_paragraph_markup_spans_lines():
+    text = '''one *two
+three* four =a<
+b= c
+no *x
+y
+z*
+
+- item'''
+    o = Org(text)
+    assert str(o) == 'Org(Paragraph(Text) UnOrderedList(ListItem))'
+    assert o.html('<br>') == ('<p>one<span style="font-weight: bold;">two<br>three</span> four'
+                              '<code>a&lt;<br>b</code> c<br>no *x<br>y<br>z*</p><br>'
+                              '<ul><li>item</li></ul>')
+    o = Org(text, coalesce=False)
+    assert str(o) == 'Org(Paragraph(Text Text Text Text Text Text) UnOrderedList(ListItem))'
+    assert Org(text, engine='regex').coalesce is False
+    # emphasis does not open on the space or line break after a line-edge *
+    for text in ('costs 5 *\nword* more', 'costs 5 * \nword* more', 'a * b\nword* c'):
+        assert Org(text).html('<br>') == Org(text, coalesce=False).html('<br>')
+        assert 'bold' not in Org(text).html('<br>')
+
+def test_parser():
+    text = '''* header
+para
+- item
+| a | b |'''
+    parser = Parser(default_heading=2)
+    o = parser.parse(text)
+    assert str(o) == str(Org(text, default_heading=2))
+    assert o.parser is parser
+    assert not hasattr(o, 'current') and not hasattr(o, 'src_flg')
+    assert str(parser.parse_lines(io.StringIO(text))) == str(o)
+    o = Parser(rules=('heading', 'unorderedlist')).parse(text)
+    assert str(o) == 'Org(Heading1(Paragraph(Text) UnOrderedList(ListItem Text)))'
+    with pytest.raises(ValueError):
+        Parser(rules=('heading', 'nothing'))
+
+def test_parser_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    parser = Parser()
+    texts = [f'* h{i}\n#+BEGIN_QUOTE\nq{i} *b*\n#+END_QUOTE\n' + '- x\n' * i
+             for i in range(50)]
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda text: parser.parse(text).html(), texts * 4))
+    assert results == [Org(text).html() for text in texts * 4]
+
+def test_tolerant_parse():
+    text = '''#+END_QUOTE
+para
+#+END_SRC
+#+BEGIN_QUOTE
+quoted
+* heading
+#+END_QUOTE
+#+BEGIN_SRC python
+code'''
+    with pytest.raises(NestingNotValidError, match='line 1: #\\+END_QUOTE without'):
+        Org(text)
+    o = Org(text, strict=False)
+    assert str(o) == 'Org(Paragraph(Text Blockquote(Text)) Heading1(CodeBlock(Text)))'
+    assert [str(d) for d in o.diagnostics] == [
+        'line 1: #+END_QUOTE without #+BEGIN_QUOTE',
+        'line 3: #+END_SRC without #+BEGIN_SRC',
+        'line 7: #+END_QUOTE outside of its quote',
+        'line 8: #+BEGIN_SRC is never closed']
+    o = Org('* a\n#+BEGIN_QUOTE\n* b\nx\n', strict=False)
+    assert [str(d) for d in o.diagnostics] == ['line 2: #+BEGIN_QUOTE is never closed']
+    assert Org(text.replace('#+END_QUOTE\npara', 'para'), strict=False).strict is False
+
+def test_tolerant_reparse():
+    o = Org('* a\n#+END_SRC\n* b\n#+BEGIN_QUOTE\n', strict=False)
+    assert [d.line for d in o.diagnostics] == [2, 4]
+    o.reparse(0, 0, 'new line\n')
+    assert [d.line for d in o.diagnostics] == [3, 5]
+    o.reparse(2, 3, '')
+    assert [str(d) for d in o.diagnostics] == ['line 4: #+BEGIN_QUOTE is never closed']
+
+def test_spans_and_node_at():
+    text = '''* header
+para *b*
+more
+
+| a |[[#x]]|
+** sub
+- item
+#+BEGIN_SRC
+code
+#+END_SRC'''
+    o = Org(text)
+    heading = o.children[0]
+    paragraph, table, sub = heading.children
+    ulist = sub.children[0]
+    code = ulist.children[1]
+    assert o.span(heading) == (0, 0, 10, 0)
+    assert o.span(paragraph) == (1, 0, 3, 0)
+    assert o.span(paragraph.children[0]) == (1, 0, 2, 4)
+    assert o.span(table) == (4, 0, 5, 0)
+    assert o.span(ulist.children[0]) == (6, 2, 6, 6)
+    assert o.span(code) == (7, 0, 10, 0)
+    assert o.span(paragraph.children[0].values[1]) is None
+    assert o.node_at(0, 3) is heading
+    assert o.node_at(1, 6) is paragraph.children[0]
+    assert o.node_at(2, 4) is paragraph  # end of line
+    assert o.node_at(3, 0) is heading
+    row = table.children[0]
+    assert o.node_at(4, 3) is row.children[0].children[0]
+    assert o.node_at(4, 6).__class__.__name__ == 'InternalLink'
+    assert o.node_at(4, 11) is row
+    assert o.node_at(6, 0) is ulist
+    assert o.node_at(6, 3) is ulist.children[0]
+    assert o.node_at(8, 2) is code
+    assert o.node_at(10, 0) is None
+    o.reparse(0, 1, 'intro\n* new header')
+    assert o.node_at(0, 0) is o.children[0].children[0]
+    assert o.span(o.children[1]) == (1, 0, 11, 0)
+    assert o.node_at(9, 1).__class__.__name__ == 'CodeBlock'
+
+
+def test_zero_copy():
+    text = '''* header
+para *b*
+more
+- item
+- term :: def
+| a | b |
+#+BEGIN_SRC python
+code
+  more code
+#+END_SRC'''
+    o = Org(text, zero_copy=True)
+    assert o.html() == Org(text).html()
+    heading = o.children[0]
+    paragraph = heading.children[0]
+    assert heading._title is None and heading.title == 'header'
+    assert paragraph.children[0]._value is None
+    assert paragraph.children[0].value == 'para *b*\nmore'
+    code = o.node_at(7)
+    assert code._body == '' and code.body == 'code\n  more code'
+    paragraph.children[0].value = 'new'
+    assert paragraph.children[0].value == 'new'
+    o.reparse(1, 3, 'other text')
+    assert o.lines is None
+    assert o.children[0].children[0].children[0].value == 'other text'
+    assert o.node_at(7).body == 'code\n  more code'
+    assert o.html() == Org(o.text).html()
+    o = Org('* a\r\ntext\r\n', zero_copy=True)
+    assert o.children[0].title == 'a'
+    assert o.children[0].children[0].children[0].value == 'text'
+    o = Org.from_lines(io.StringIO(text), zero_copy=True)
+    assert o.html() == Org(text).html()
+
+
+def test_outline():
+    text = '''intro
+* First One
+text
+#+BEGIN_SRC org
+* not a heading
+#+END_SRC
+** Sub Heading
+*bold* line
+*** Déjà vu'''
+    entries = outline(text)
+    assert entries == [
+        (1, 'First One', 'first-one', 1, 6),
+        (2, 'Sub Heading', 'sub-heading', 6, 65),
+        (3, 'Déjà vu', 'deja-vu', 8, 92),
+    ]
+    assert [(d, t, l) for d, t, s, l, o in entries] == [
+        (h.depth, h.title, l) for l, h, c in Org(text)._headings]
+    assert text[65:].startswith('** Sub Heading')
+    data = text.replace('\n', '\r\n').encode()
+    entries = outline(data, default_heading=2, slugs=False)
+    assert entries[2] == (4, 'Déjà vu', None, 8, 100)
+    assert data[100:].startswith('*** D'.encode())
+    # a drawer cannot hold a source block, so the block hides the heading
+    # from the parser as from outline()
+    for text in ('* a\n:LOGBOOK:\n#+BEGIN_SRC\n:END:\n* b',
+                 '* a\n:X:\n#+BEGIN_SRC\n* b\n#+END_SRC\n:END:\n* c'):
+        assert [(d, t, l) for d, t, s, l, o in outline(text)] == [
+            (h.depth, h.title, l) for l, h, c in Org(text, strict=False)._headings]
+    assert [t for d, t, s, l, o in outline('* a\n:LOGBOOK:\n#+BEGIN_SRC\n:END:\n* b')] == ['a']
+    org = Org('* a\n:X:\n#+BEGIN_SRC\n* b\n#+END_SRC\n:END:\n* c')
+    assert str(org) == 'Org(Heading1(Paragraph(Text CodeBlock(Text) Text)) Heading1())'
+    assert org.children[0].drawers == {}
+
+
+def test_section_index(tmp_path):
+    from pyorg2.section_index import SectionIndex
+    text = '''* A
+a text
+** A1
+#+BEGIN_SRC
+* not a heading
+#+END_SRC
+** Ä2
+* B
+b
+'''
+    path = tmp_path / 'big.org'
+    path.write_bytes(text.encode())
+    index = SectionIndex(path)
+    assert (tmp_path / 'big.org.idx').is_file()
+    assert [s.path for s in index.sections] == [('A',), ('A', 'A1'), ('A', 'Ä2'), ('B',)]
+    assert index.read('a2') == '** Ä2\n'
+    section = index.find(('A', 'A1'))
+    assert text.encode()[section.start:section.end].decode().startswith('** A1\n')
+    org = index.parse(('A', 'A1'))
+    assert org.children[0].depth == 2
+    assert org.html() == '<h2>A1</h2><pre><code>* not a heading</code></pre>'
+    assert index.parse('a1', default_heading=1).children[0].depth == 1
+    assert ''.join(index.parse(s.path).html() for s in index.sections
+                   if s.level == 1) == Org(text).html()
+    assert not SectionIndex(path).refresh()  # loaded from the sidecar
+    path.write_bytes((text + '* C\n').encode())
+    os.utime(path, ns=(0, 0))
+    assert index.find('c').start == len(text.encode())
+    with pytest.raises(KeyError):
+        index.read('missing')
+
+
+def test_skip_excluded():
+    text = '''* Kept
+text
+** COMMENT draft <<a>>
+hidden *text*
+*** deeper
+** Old :work:ARCHIVE:
+#+BEGIN_SRC org
+* not a heading
+#+END_SRC
+still hidden <<b>>
+** Next
+* Private :noexport:
+- item
+* COMMENTS are fine'''
+    o = Org(text, skip_excluded=True)
+    assert o.html() == '<h1>Kept</h1><p>text</p><h2>Next</h2><h1>COMMENTS are fine</h1>'
+    assert o.targets == {}
+    assert len(o._span_nodes) == 5
+    assert 'draft' in Org(text).html()
+    o.reparse(5, 6, '** Old :work:')
+    assert o.html() == Org('\n'.join(o.lines), skip_excluded=True).html()
+    assert '<h2>Old :work:</h2><pre><code class="org">' in o.html()
+
+
+def test_drawers():
+    text = '''* Task
+:PROPERTIES:
+:ID: abc-1
+:CATEGORY: work
+:CATEGORY+: home
+:END:
+:LOGBOOK:
+CLOCK: [2024-01-02 Tue 09:00]--[2024-01-02 Tue 10:30] =>  1:30
+CLOCK: [2024-01-03 Wed 09:00]
+- Note taken on [2024-01-02 Tue] \\\\
+  it *works*
+:end:
+text
+:smile:
+more
+** Sub'''
+    o = Org(text)
+    task = o.children[0]
+    assert o.html() == '<h1>Task</h1><p>text:smile:more</p><h2>Sub</h2>'
+    assert list(task.drawers) == ['PROPERTIES', 'LOGBOOK']
+    logbook = task.drawers['LOGBOOK']
+    assert logbook._clocks is None and len(logbook.lines) == 4
+    assert logbook.clocks == [('2024-01-02 Tue 09:00', '2024-01-02 Tue 10:30', '1:30'),
+                              ('2024-01-03 Wed 09:00', None, None)]
+    assert task.drawers['PROPERTIES'].properties == {'ID': 'abc-1', 'CATEGORY': 'work home'}
+    assert 'bold;">works</span>' in logbook.org.html()
+    assert o.node_at(8) is logbook and logbook.parent is task
+    assert o.span(task) == (0, 0, 16, 0)
+    zero_copy = Org(text, zero_copy=True)  # kept, nodes only hold it weakly
+    assert zero_copy.children[0].drawers['LOGBOOK'].lines == logbook.lines
+    # a drawer line with no :END: before the next heading is text
+    assert Org('* a\n:x:\ny\n* b').html() == '<h1>a</h1><p>:x:y</p><h1>b</h1>'
+    assert Parser(rules=('heading',)).parse(text).children[0].drawers == {}
+
+
+def test_lint():
+    from pyorg2.lint import lint
+    text = '''* Intro
+see <<here>>
+[[#here]]
+[[#Intro]]
+[[#nowhere]]
+- a
+    - b
+  - c
+| a | b |
+| c |
+|---+---|
+#+BEGIN_SRC
+#+END_QUOTE
+#+END_SRC
+#+END_QUOTE
+#+BEGIN_QUOTE
+* Next
+#+END_QUOTE
+#+BEGIN_SRC'''
+    assert [str(d) for d in lint(text)] == [
+        'line 3: link to #here has no target',  # the first line of a paragraph is no target
+        'line 5: link to #nowhere has no target',
+        'line 8: list item indent 2 lines up with no enclosing item',
+        'line 10: table row has 1 cells, the table has 2',
+        'line 15: #+END_QUOTE without #+BEGIN_QUOTE',
+        'line 18: #+END_QUOTE outside of its quote',
+        'line 19: #+BEGIN_SRC is never closed',
+    ]
+    assert lint(io.StringIO('* a\n:LOGBOOK:\n#+END_SRC\n:END:\n')) == []
+    assert [str(d) for d in lint('* a\n:LOGBOOK:\n#+BEGIN_SRC\n:END:\n* b')] == [
+        'line 3: #+BEGIN_SRC is never closed']
+    assert [str(d) for d in lint('* a\n:x:\n#+END_SRC\n* b')] == [
+        'line 3: #+END_SRC without #+BEGIN_SRC']
+    # targets count where the parser registers them, as Org.html() resolves the links
+    for text in ('x <<t>> y\n[[#t]]', '- item <<t>>\n\n[[#t]]', 'p\nq <<a>> <<t>>\n\n[[#t]]'):
+        assert [str(d) for d in lint(text)] == [
+            f'line {text.count(chr(10)) + 1}: link to #t has no target']
+        assert '<a href' not in Org(text).html()
+    assert lint('p\nq <<t>>\n\n[[#t]]') == lint('| a | <<t>> |\n[[#t]]') == []
+
+
+def test_extra_rules():
+    class Rule(Node):
+        def html(self, br='', lstrip=False):
+            return '<hr>'
+
+    def title(builder, m, line, lineno):
+        builder.org.title = m.group('title')
+
+    rules = [LineRule('rule', r'\s*-{5,}\s*$', '-', lambda b, m, line, lineno: b.add_node(Rule(b.org), lineno)),
+             LineRule('title', r'#\+TITLE:\s*(?P<title>.*)$', ['#+TITLE:'], title)]
+    text = '#+TITLE: Notes\n* a\ntext\n-----\n- item\n  -----'
+    for engine in Parser.engines:
+        parser = Parser(engine=engine, extra_rules=rules)
+        o = parser.parse(text)
+        assert o.title == 'Notes'
+        assert o.html() == '<h1>a</h1><p>text</p><hr><ul><li>item</li><hr></ul>'
+        assert o.node_at(3).__class__ is Rule
+    o = Parser(extra_rules=rules, rules=('heading', 'rule')).parse(text)
+    assert not hasattr(o, 'title') and o.html().startswith('<p>#+TITLE: Notes</p>')
+    assert Parser().parse(text).html() == '<p>#+TITLE: Notes</p><h1>a</h1><p>text-----</p><ul><li>item</li>  -----</ul>'
+    with pytest.raises(ValueError):
+        Parser(extra_rules=[LineRule('heading', r'x', 'x', title)])
+    # a rule triggered on a digit comes after the ordered lists in both engines
+    year = LineRule('year', r'(?P<year>\d{4}):', ['1', '2'],
+                    lambda b, m, line, lineno: b.add_node(Rule(b.org), lineno))
+    text = '1. first\n2. second\n2024: done'
+    trees = [str(Parser(engine=engine, extra_rules=[year]).parse(text)) for engine in Parser.engines]
+    assert trees == ['Org(OrderedList(ListItem ListItem Rule()))'] * 2
+
+
+def test_parse_async():
+    text = '* a\ntext <<t>>\nmore <<t2>>\n- item\n#+BEGIN_SRC\ncode\n#+END_SRC\n' * 20
+
+    async def chunks():
+        for line in io.BytesIO(text.encode()):
+            yield line
+
+    async def run(source, **kwargs):
+        ticks = []
+        other = asyncio.create_task(asyncio.sleep(0))
+        org = await parse_async(source, yield_every=10, progress=lambda *a: ticks.append(a),
+                                **kwargs)
+        assert other.done()  # the loop ran while parsing
+        return org, ticks
+
+    org, ticks = asyncio.run(run(text))
+    assert org.html() == Org(text).html() and org.text == text
+    assert ticks[0] == (10, 140) and ticks[-1] == (140, 140) and len(ticks) == 15
+    org, ticks = asyncio.run(run(chunks(), zero_copy=True))
+    assert org.html() == Org(text).html() and ticks[0] == (10, None)
+    assert org.children[0].children[0].children[0].value == 'text <<t>>\nmore <<t2>>'
+    org, ticks = asyncio.run(run(io.StringIO(text), strict=False))
+    assert org.html() == Org(text).html()
+
+    async def cancel():
+        task = asyncio.create_task(parse_async(text * 100, yield_every=10))
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    asyncio.run(cancel())
+
+
+def test_limits():
+    def limit_hit(text, **kwargs):
+        with pytest.raises(LimitExceededError) as info:
+            Org(text, limits=Limits(**kwargs)).html()
+        return info.value.limit, str(info.value)
+
+    assert limit_hit('a\n' + 'b' * 101, max_line_length=100) == (
+        'max_line_length', 'line 2: 101 characters, the limit is 100')
+    assert limit_hit('- a\n' * 10, max_nodes=5)[0] == 'max_nodes'
+    deep = ''.join('  ' * i + '- item\n' for i in range(20))
+    assert limit_hit(deep, max_depth=10) == ('max_depth', 'line 10: nodes nested over 10 deep')
+    assert limit_hit('#+BEGIN_QUOTE\n' * 20, max_depth=10)[0] == 'max_depth'
+    assert limit_hit('*a /b/ c*', max_inline_depth=0)[0] == 'max_inline_depth'
+    assert limit_hit('text\n' * 10, max_seconds=-1)[0] == 'max_seconds'
+    text = deep + '*a /b/ c*'
+    assert Org(text, limits=Limits()).html() == Org(text).html()
+    # a reparse counts the whole document, not only the section it parses
+    o = Org('* a\n- x\n* b\n- y\n- z', limits=Limits(max_nodes=7))
+    before = str(o)
+    with pytest.raises(LimitExceededError) as info:
+        o.reparse(1, 2, '- x\n- w')
+    assert str(info.value) == 'line 2: document of 8 nodes, the limit is 7'
+    assert str(o) == before and o.text == '* a\n- x\n* b\n- y\n- z'
+    o.reparse(1, 2, '- w')
+    assert str(o) == before
+
+
+def test_parse_parallel():
+    from concurrent.futures import ProcessPoolExecutor
+    text = ('* a <<t>>\ntext <<t>>\n- item\n#+BEGIN_SRC\n* code\n#+END_SRC\n'
+            '** b\n:LOGBOOK:\nCLOCK: x\n:END:\n| c | <<t2>> |\n') * 10
+
+    def same(org, serial):
+        assert str(org) == str(serial) and org.html() == serial.html()
+        assert list(org._spans) == list(serial._spans)
+        assert [(line, heading.title) for line, heading, _ in org._headings] == [
+            (line, heading.title) for line, heading, _ in serial._headings]
+        assert [str(d) for d in org.diagnostics] == [str(d) for d in serial.diagnostics]
+        assert all(node.org_root is org for node in org._span_nodes)
+
+    with ProcessPoolExecutor(2) as executor:
+        org = parse_parallel(text, chunk_lines=20, executor=executor)
+        assert len(org.children) == 10 and org.children[9].parent is org
+        table = org.children[9].children[2].children[0]
+        assert org.targets['t2'] is table.children[0].children[1]
+        same(org, Org(text))
+        assert org.span(org.children[9]) == (99, 0, 110, 0)
+        org = parse_parallel(text, chunk_lines=1, executor=executor, zero_copy=True)
+        same(org, Org(text, zero_copy=True))
+        assert org.children[9].children[2].title == 'b'
+        # a quote that a top level heading leaves open joins the pieces
+        quoted = text.replace('** b\n', '** b\n#+BEGIN_QUOTE\n', 1) + '#+END_QUOTE\n'
+        org = parse_parallel(quoted, chunk_lines=1, executor=executor, strict=False)
+        same(org, Org(quoted, strict=False))
+        assert str(org.diagnostics[0]) == 'line 112: #+END_QUOTE outside of its quote'
+        with pytest.raises(NestingNotValidError, match='line 112'):
+            parse_parallel(quoted, chunk_lines=1, executor=executor)
+    assert parse_parallel('* a\n* b\n', processes=1).html() == Org('* a\n* b\n').html()
+
+
+def test_node_slots():
+    org = Org('* a\ntext\n- item\n| cell |\n#+BEGIN_SRC\ncode\n#+END_SRC\n', zero_copy=True)
+    for node in org._span_nodes:
+        assert not hasattr(node, '__dict__'), node
+        assert node.is_target is False and node.target_string is None
+    heading = org.children[0]
+    assert heading.type_ == 'Heading1' and heading.title == 'a'
+    assert heading.children[0].type_ == 'Paragraph'
+    assert str(org) == ('Org(Heading1(Paragraph(Text) UnOrderedList(ListItem '
+                        'Table(TableRow(TableCell(Text)) CodeBlock(Text)))))')
+    # the target attributes can still be set on any node, and are kept by pickle
+    heading.is_target, heading.target_string = True, 'a'
+    assert not hasattr(heading, '__dict__')
+    assert heading.is_target is True and heading.target_string == 'a'
+    copy = pickle.loads(pickle.dumps(org)).children[0]
+    assert copy.is_target is True and copy.target_string == 'a'
+    assert copy.children[0].is_target is False and copy.children[0].target_string is None
+
+
+def test_no_reference_cycles():
+    text = ('* a <<t>>\n- b\n[[#a]]\n| c | <<u>> |\n** s\n:X:\n:K: v\n:END:\n'
+            'text *b* [[http://x][y]]\n#+BEGIN_SRC\nx\n#+END_SRC\n')
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for kwargs in ({}, {'zero_copy': True}):
+            org = Org(text, **kwargs)
+            org.html()
+            heading = org.children[0]
+            assert heading.children[-1].drawers['X'].org.html() == '<p>:K: v</p>'
+            refs = [weakref.ref(node) for node in org._span_nodes + [org]]
+            del org
+            assert heading.parent is None and heading.org_root is None
+            del heading
+            assert not [r for r in refs if r() is not None]  # freed without the collector
+    finally:
+        if collecting:
+            gc.enable()
+    org = Org(text)
+    heading = org.children[0]
+    org.close()
+    assert org.children == [] and org.targets == {} and org.html() == ''
+    assert heading.org_root is org and heading.parent is org  # kept by the caller
+
+def test_node_outlives_org():
+    text = '* Title\ntext\n:LOGBOOK:\nCLOCK: [a]\n:END:'
+    heading = Org(text).children[0]
+    assert heading.title == 'Title'
+    assert heading.children[0].children[0].value == 'text'
+    assert heading.html() == '<h1>Title</h1><p>text</p>'
+    with pytest.raises(ReferenceError):
+        heading.drawers['LOGBOOK'].org
+    # a zero copy node reads its source from the Org
+    heading = Org(text, zero_copy=True).children[0]
+    for read in (lambda: heading.title,
+                 lambda: heading.children[0].children[0].value,
+                 lambda: heading.drawers['LOGBOOK'].lines):
+        with pytest.raises(ReferenceError, match='keep a reference to the Org'):
+            read()
@@ -1,7 +1,8 @@
 from pathlib import Path
 from bs4 import BeautifulSoup
 import pytest
-from pyorg2.file_parser import parse_org_file, parse_org_directory, parse_org_files
+from pyorg2.file_parser import OrgFileParser, parse_org_file, parse_org_directory, parse_org_files
+from pyorg2.org import NestingNotValidError
 
 @pytest.fixture
 def sample_files(tmp_path):
@@ -56,3 +57,19 @@ def test_file_list(sample_files):
     assert link_2['href'] == '#abc-456', "Link href mismatch"
     assert link_2.text == 'Trade Networks', "Link text mismatch"
 
+
+def test_directory_tolerant(sample_files):
+    directory = Path(sample_files[0]).parent
+    bad = directory / "broken.org"
+    bad.write_text("* Broken\n#+BEGIN_QUOTE\nnever closed\n#+END_SRC\n")
+    with pytest.raises(NestingNotValidError):
+        OrgFileParser().parse_directory(directory)
+    parser = OrgFileParser(strict=False)
+    nodes = parser.parse_directory(directory)
+    assert len(nodes) == 4
+    assert list(parser.diagnostics) == [bad]
+    assert [str(d) for d in parser.diagnostics[bad]] == [
+        'line 4: #+END_SRC without #+BEGIN_SRC',
+        'line 2: #+BEGIN_QUOTE is never closed']
+    html = parser.to_html(newline='\n')
+    assert '<h1>Broken</h1>' in html and '<h1>Trade Networks</h1>' in html
@@ -0,0 +1,94 @@
+import time
+from re import compile
+import pytest
+from pyorg2.org import Syntax, Org, NestingNotValidError
+from pyorg2.lint import lint
+
+# Lines built to make backtracking regexps go quadratic or worse. With
+# linear patterns each one takes a few milliseconds.
+N = 10000
+TIME_LIMIT = 1.0
+
+LINE_PATTERNS = {
+    'HEADING': ['*' * N + 'a', '* ' + ' ' * N],
+    'ORDERED_LIST': [' ' * N + '1', ' ' * N + '1. ' + ' ' * N],
+    'UNORDERED_LIST': [' ' * N + '-', ' ' * N + '- ' + ' ' * N],
+    'DEF_LIST': ['- a' + ' ' * N + 'b ::c', '- ' + ' ' * N + 'x',
+                 '- ' + 'a ' * N + ':', '-' + ' ' * N + 'a :: ' + ' ' * N,
+                 '- ' + 'a::' * N],
+    'TABLE_ROW': ['|' + 'a|' * N + 'x', '|' * N + 'x', '| ' + 'a' * N],
+    'QUOTE_BEGIN': ['#+BEGIN_QUOTE:' + ' ' * N],
+    'SRC_BEGIN': ['#+BEGIN_SRC' + ' ' * N + 'x'],
+    'WHITELINE': [' ' * N + 'x'],
+    'DRAWER_BEGIN': [' ' * N + ':a', ':' + 'a' * N, ':a:' + ' ' * N + 'x'],
+    'DRAWER_END': [' ' * N + ':END', ':END:' + ' ' * N + 'x'],
+}
+
+INLINE_PATTERNS = {
+    'LINK': ['[[http://' * N, '[[http://a]' * N, '[[http://a][' * N],
+    'IMAGE': ['[[' * N, '[[a]' * N, '[[a][' * N],
+    'INTERNAL_LINK': ['[[#a][' * N, '[[#' * N],
+    'BOLD': ['*' * N, '*a' * N, '**' + 'a' * N, '*a\n' * N, '*\n' * N],
+    'ITALIC': ['/' * N + 'a', '/a' * N],
+    'UNDERLINED': ['_' * N + 'a'],
+    'LINETHROUGH': ['+' * N + 'a'],
+    'CODE': ['=' * N],
+    'MONOSPACE': ['~' * N + 'a'],
+    'TARGET': ['<<' * N, '<<a' * N],
+}
+
+
+def cases(patterns):
+    return [pytest.param(name, line, id=f'{name}-{index}')
+            for name, lines in patterns.items()
+            for index, line in enumerate(lines)]
+
+
+def elapsed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+@pytest.mark.parametrize('name,line', cases(LINE_PATTERNS))
+def test_line_pattern_linear(name, line):
+    regexp = compile(getattr(Syntax, name))
+    assert elapsed(regexp.match, line) < TIME_LIMIT
+
+
+@pytest.mark.parametrize('name,line', cases(INLINE_PATTERNS))
+def test_inline_pattern_linear(name, line):
+    regexp = compile(getattr(Syntax, name))
+    assert elapsed(lambda: list(regexp.finditer(line))) < TIME_LIMIT
+
+
+@pytest.mark.parametrize('name,line', cases(LINE_PATTERNS) + cases(INLINE_PATTERNS))
+def test_parse_adversarial_line(name, line):
+    def parse():
+        try:
+            Org(line).html()
+        except NestingNotValidError:
+            pass
+    assert elapsed(parse) < TIME_LIMIT
+
+
+# Whole documents that made the parser read lines again and again
+DOCUMENT_PATTERNS = {
+    'ABANDONED_DRAWERS': ['* H\n' + ':A:\n' * N, '* H\n' + ':A:\nx\n' * N],
+}
+
+
+@pytest.mark.parametrize('name,text', cases(DOCUMENT_PATTERNS))
+def test_parse_adversarial_document(name, text):
+    assert elapsed(lambda: Org(text).html()) < TIME_LIMIT
+    assert elapsed(lint, text) < TIME_LIMIT
+
+
+def test_patterns_still_match():
+    assert compile(Syntax.TABLE_ROW).match('| a | b |  ').group('cells') == ' a | b |'
+    assert compile(Syntax.BOLD).search('a **b** c').group('text') == '*b'
+    m = compile(Syntax.DEF_LIST).match('- term one :: desc :: more')
+    assert (m.group('item'), m.group('desc')) == ('term one', 'desc :: more')
+    m = compile(Syntax.LINK).search('see [[https://example.com/a][the site]]')
+    assert (m.group('url'), m.group('subject')) == ('https://example.com/a', 'the site')
+    assert compile(Syntax.TARGET).search('x <<<a>> y').group('target') == 'a'
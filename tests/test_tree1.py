@@ -1,4 +1,5 @@
 import json
+import weakref
 from pathlib import Path
 import pytest
 from pyorg2.tree import (Root, Branch, Section, Heading, Text, Paragraph, BlankLine, TargetText,
@@ -16,3 +17,13 @@ from pyorg2.dev_utils import build_tree_1
 def test_everything_1():
     root = build_tree_1()
     print(root.to_html())
+
+
+def test_weak_back_links():
+    root = build_tree_1()
+    section = root.trunk.children[0]
+    assert section.parent is root.trunk and section.root is root
+    assert root.link_targets['Target 1'].target_node.text == 'Target 1'
+    trunk = weakref.ref(root.trunk)
+    del root
+    assert trunk() is None and section.root is None